@@ -1,5 +1,47 @@
 import multiprocessing
+import resource
+import time
 
 daemon = True
 workers = 2 * multiprocessing.cpu_count() + 1
 worker_class = "sync"
+
+# Keep the listen queue short, so excess load is refused quickly instead of
+# waiting behind requests that will time out. The app sheds the rest, with
+# the limits in the [admission] and [concurrency] config sections.
+backlog = 64
+
+# Import the app once in the master so workers share that memory
+# copy-on-write. Safe because each worker opens its own database
+# connection after forking (see post_fork).
+preload_app = True
+
+
+def pre_fork(server, worker):
+    worker.boot_started = time.time()
+
+
+def post_fork(server, worker):
+    import database
+    database.connect()
+
+
+def post_worker_init(worker):
+    """Logs each worker's boot time and memory use."""
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # RSS counts pages shared with the master; PSS splits them between
+    # the processes sharing them, so it shows the saving from preloading.
+    pss = "unknown"
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                if line.startswith("Pss:"):
+                    pss = line.split()[1]
+    except OSError:
+        pass
+
+    worker.log.info("Worker %s booted in %.3fs: max RSS %s kB, PSS %s kB",
+                    worker.pid, time.time() - worker.boot_started,
+                    max_rss, pss)
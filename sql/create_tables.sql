@@ -23,18 +23,53 @@ CREATE TABLE feature_request.feature_requests
    title text NOT NULL,
    description text NOT NULL,
    client_id integer NOT NULL,
-   client_priority integer NOT NULL DEFAULT 1,
+   -- Sparse ordering within the client; the API exposes dense priorities
+   client_rank bigint NOT NULL DEFAULT 0,
    target_date date NOT NULL,
    ticket_url text,
    product_area_id integer NOT NULL,
-   PRIMARY KEY (_id),
+   -- Incremented by every edit, for optimistic concurrency control
+   version integer NOT NULL DEFAULT 1,
+   PRIMARY KEY (client_id, _id),
    FOREIGN KEY (client_id)
        REFERENCES feature_request.clients (_id)
        ON UPDATE CASCADE ON DELETE CASCADE,
    FOREIGN KEY (product_area_id)
        REFERENCES feature_request.product_areas (_id)
        ON UPDATE CASCADE ON DELETE CASCADE
-);
+)
+-- One partition per client, created by create_client_partition() below
+PARTITION BY LIST (client_id);
+
+-- Catches requests for clients whose partition doesn't exist yet
+CREATE TABLE feature_request.feature_requests_default
+    PARTITION OF feature_request.feature_requests DEFAULT;
+
+CREATE INDEX feature_requests_client_rank_idx
+    ON feature_request.feature_requests (client_id, client_rank);
+
+-- For lookups by ID alone, which can't be pruned to one partition
+CREATE INDEX feature_requests_id_idx
+    ON feature_request.feature_requests (_id);
+
+
+CREATE FUNCTION feature_request.create_client_partition() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS feature_request.%I
+                        PARTITION OF feature_request.feature_requests
+                        FOR VALUES IN (%s)',
+                   'feature_requests_' || NEW._id, NEW._id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- BEFORE, so the partition exists by the time ON UPDATE CASCADE moves a
+-- renumbered client's requests. Created afterwards, they'd have landed in
+-- the default partition, which then can't give them up.
+CREATE TRIGGER create_client_partition
+    BEFORE INSERT OR UPDATE OF _id ON feature_request.clients
+    FOR EACH ROW
+    EXECUTE PROCEDURE feature_request.create_client_partition();
 
 
 CREATE TABLE feature_request.users
@@ -57,3 +92,102 @@ CREATE TABLE feature_request.sessions
        REFERENCES feature_request.users (username)
        ON UPDATE CASCADE ON DELETE CASCADE
 );
+
+-- Every authenticated request looks its session up by token
+CREATE INDEX sessions_token_idx
+    ON feature_request.sessions (token);
+
+
+-- Summary of feature requests, kept in step with feature_requests by the
+-- triggers below. Reports read this instead of scanning every request.
+CREATE TABLE feature_request.feature_request_counts
+(
+   client_id integer NOT NULL,
+   product_area_id integer NOT NULL,
+   target_date date NOT NULL,
+   request_count integer NOT NULL DEFAULT 0,
+   PRIMARY KEY (client_id, product_area_id, target_date)
+);
+
+
+-- Single row recording when the summary was last rebuilt from scratch
+CREATE TABLE feature_request.report_refreshes
+(
+   refreshed timestamp without time zone NOT NULL DEFAULT now()
+);
+
+INSERT INTO feature_request.report_refreshes DEFAULT VALUES;
+
+
+CREATE FUNCTION feature_request.count_feature_requests() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE feature_request.feature_request_counts
+        SET request_count = request_count - 1
+        WHERE client_id = OLD.client_id
+            AND product_area_id = OLD.product_area_id
+            AND target_date = OLD.target_date;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO feature_request.feature_request_counts
+            (client_id, product_area_id, target_date, request_count)
+            VALUES (NEW.client_id, NEW.product_area_id, NEW.target_date, 1)
+        ON CONFLICT (client_id, product_area_id, target_date)
+            DO UPDATE SET request_count = feature_request_counts.request_count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE FUNCTION feature_request.clear_feature_request_counts() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM feature_request.feature_request_counts;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Rebuilds the summary from feature_requests, for when it may have drifted
+-- (e.g. rows loaded with triggers disabled). Returns the refresh time.
+CREATE FUNCTION feature_request.refresh_feature_request_counts() RETURNS timestamp AS $$
+BEGIN
+    -- Block writers so the rebuilt counts match the table exactly
+    LOCK TABLE feature_request.feature_requests IN SHARE MODE;
+
+    DELETE FROM feature_request.feature_request_counts;
+
+    INSERT INTO feature_request.feature_request_counts
+        (client_id, product_area_id, target_date, request_count)
+        SELECT client_id, product_area_id, target_date, count(*)
+        FROM feature_request.feature_requests
+        GROUP BY client_id, product_area_id, target_date;
+
+    UPDATE feature_request.report_refreshes
+    SET refreshed = now();
+
+    RETURN now();
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE TRIGGER count_feature_requests
+    AFTER INSERT OR DELETE ON feature_request.feature_requests
+    FOR EACH ROW
+    EXECUTE PROCEDURE feature_request.count_feature_requests();
+
+CREATE TRIGGER count_updated_feature_requests
+    AFTER UPDATE OF client_id, product_area_id, target_date
+    ON feature_request.feature_requests
+    FOR EACH ROW
+    WHEN (OLD.client_id IS DISTINCT FROM NEW.client_id
+          OR OLD.product_area_id IS DISTINCT FROM NEW.product_area_id
+          OR OLD.target_date IS DISTINCT FROM NEW.target_date)
+    EXECUTE PROCEDURE feature_request.count_feature_requests();
+
+CREATE TRIGGER clear_feature_request_counts
+    AFTER TRUNCATE ON feature_request.feature_requests
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE feature_request.clear_feature_request_counts();
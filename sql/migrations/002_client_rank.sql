@@ -0,0 +1,21 @@
+-- Replaces dense client_priority values with sparse client_rank values,
+-- so reprioritizing a feature request only rewrites that request.
+-- Run once against an existing database; create_tables.sql includes this.
+
+ALTER TABLE feature_request.feature_requests
+    RENAME COLUMN client_priority TO client_rank;
+
+ALTER TABLE feature_request.feature_requests
+    ALTER COLUMN client_rank TYPE bigint,
+    ALTER COLUMN client_rank SET DEFAULT 0;
+
+UPDATE feature_request.feature_requests AS requests
+SET client_rank = ranked.position * 65536
+FROM (SELECT _id, row_number() OVER (PARTITION BY client_id
+                                     ORDER BY client_rank, _id) AS position
+      FROM feature_request.feature_requests
+     ) AS ranked
+WHERE requests._id = ranked._id;
+
+CREATE INDEX feature_requests_client_rank_idx
+    ON feature_request.feature_requests (client_id, client_rank);
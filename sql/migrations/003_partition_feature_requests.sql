@@ -0,0 +1,117 @@
+-- Partitions feature_requests by client, moving existing requests into a
+-- partition per client. Run once against an existing database, after
+-- 001_reports.sql and 002_client_rank.sql; create_tables.sql includes this.
+--
+-- Blocks access to feature requests while the data is copied.
+
+BEGIN;
+
+ALTER TABLE feature_request.feature_requests
+    RENAME TO feature_requests_unpartitioned;
+ALTER TABLE feature_request.feature_requests_unpartitioned
+    RENAME CONSTRAINT feature_requests_pkey TO feature_requests_unpartitioned_pkey;
+ALTER INDEX feature_request.feature_requests_client_rank_idx
+    RENAME TO feature_requests_unpartitioned_client_rank_idx;
+
+
+CREATE TABLE feature_request.feature_requests
+(
+   _id uuid NOT NULL,
+   title text NOT NULL,
+   description text NOT NULL,
+   client_id integer NOT NULL,
+   -- Sparse ordering within the client; the API exposes dense priorities
+   client_rank bigint NOT NULL DEFAULT 0,
+   target_date date NOT NULL,
+   ticket_url text,
+   product_area_id integer NOT NULL,
+   PRIMARY KEY (client_id, _id),
+   FOREIGN KEY (client_id)
+       REFERENCES feature_request.clients (_id)
+       ON UPDATE CASCADE ON DELETE CASCADE,
+   FOREIGN KEY (product_area_id)
+       REFERENCES feature_request.product_areas (_id)
+       ON UPDATE CASCADE ON DELETE CASCADE
+)
+-- One partition per client, created by create_client_partition() below
+PARTITION BY LIST (client_id);
+
+-- Catches requests for clients whose partition doesn't exist yet
+CREATE TABLE feature_request.feature_requests_default
+    PARTITION OF feature_request.feature_requests DEFAULT;
+
+CREATE INDEX feature_requests_client_rank_idx
+    ON feature_request.feature_requests (client_id, client_rank);
+
+-- For lookups by ID alone, which can't be pruned to one partition
+CREATE INDEX feature_requests_id_idx
+    ON feature_request.feature_requests (_id);
+
+
+CREATE FUNCTION feature_request.create_client_partition() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS feature_request.%I
+                        PARTITION OF feature_request.feature_requests
+                        FOR VALUES IN (%s)',
+                   'feature_requests_' || NEW._id, NEW._id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- BEFORE, so the partition exists by the time ON UPDATE CASCADE moves a
+-- renumbered client's requests. Created afterwards, they'd have landed in
+-- the default partition, which then can't give them up.
+CREATE TRIGGER create_client_partition
+    BEFORE INSERT OR UPDATE OF _id ON feature_request.clients
+    FOR EACH ROW
+    EXECUTE PROCEDURE feature_request.create_client_partition();
+
+
+-- Create partitions for existing clients
+DO $$
+DECLARE
+    client integer;
+BEGIN
+    FOR client IN SELECT _id FROM feature_request.clients LOOP
+        EXECUTE format('CREATE TABLE feature_request.%I
+                            PARTITION OF feature_request.feature_requests
+                            FOR VALUES IN (%s)',
+                       'feature_requests_' || client, client);
+    END LOOP;
+END;
+$$;
+
+
+-- The report summary already counts these rows, so copy them before
+-- adding the triggers that maintain it.
+INSERT INTO feature_request.feature_requests
+    (_id, title, description, client_id, client_rank,
+     target_date, ticket_url, product_area_id)
+    SELECT _id, title, description, client_id, client_rank,
+        target_date, ticket_url, product_area_id
+    FROM feature_request.feature_requests_unpartitioned;
+
+DROP TABLE feature_request.feature_requests_unpartitioned;
+
+CREATE TRIGGER count_feature_requests
+    AFTER INSERT OR DELETE ON feature_request.feature_requests
+    FOR EACH ROW
+    EXECUTE PROCEDURE feature_request.count_feature_requests();
+
+CREATE TRIGGER count_updated_feature_requests
+    AFTER UPDATE OF client_id, product_area_id, target_date
+    ON feature_request.feature_requests
+    FOR EACH ROW
+    WHEN (OLD.client_id IS DISTINCT FROM NEW.client_id
+          OR OLD.product_area_id IS DISTINCT FROM NEW.product_area_id
+          OR OLD.target_date IS DISTINCT FROM NEW.target_date)
+    EXECUTE PROCEDURE feature_request.count_feature_requests();
+
+CREATE TRIGGER clear_feature_request_counts
+    AFTER TRUNCATE ON feature_request.feature_requests
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE feature_request.clear_feature_request_counts();
+
+COMMIT;
+
+ANALYZE feature_request.feature_requests;
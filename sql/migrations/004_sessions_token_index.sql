@@ -0,0 +1,5 @@
+-- Indexes session lookups by token, which otherwise scan every session.
+-- Run once against an existing database; create_tables.sql includes this.
+
+CREATE INDEX CONCURRENTLY sessions_token_idx
+    ON feature_request.sessions (token);
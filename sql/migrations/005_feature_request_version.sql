@@ -0,0 +1,5 @@
+-- Adds a version to feature requests, for optimistic concurrency control.
+-- Run once against an existing database; create_tables.sql includes this.
+
+ALTER TABLE feature_request.feature_requests
+    ADD COLUMN version integer NOT NULL DEFAULT 1;
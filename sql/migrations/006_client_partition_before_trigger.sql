@@ -0,0 +1,20 @@
+-- Creates client partitions before a client is renumbered, rather than
+-- after, when its requests have already cascaded into the default partition.
+-- Run once against an existing database; create_tables.sql includes this.
+
+CREATE OR REPLACE FUNCTION feature_request.create_client_partition() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS feature_request.%I
+                        PARTITION OF feature_request.feature_requests
+                        FOR VALUES IN (%s)',
+                   'feature_requests_' || NEW._id, NEW._id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER create_client_partition ON feature_request.clients;
+
+CREATE TRIGGER create_client_partition
+    BEFORE INSERT OR UPDATE OF _id ON feature_request.clients
+    FOR EACH ROW
+    EXECUTE PROCEDURE feature_request.create_client_partition();
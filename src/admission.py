@@ -0,0 +1,301 @@
+"""Admission control shared between worker processes.
+
+Limits how many requests are handled at once, overall and per endpoint, and
+how fast each user may make requests, shedding excess load with an
+AdmissionException rather than letting it queue.
+
+The counters live in an anonymous shared memory map. When the app is
+preloaded, the map is created in gunicorn's master before the workers are
+forked, so all of them share the same counters. Otherwise each process
+enforces the limits on its own.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+
+
+# Per-process in-flight counters: pid, then global and per-endpoint counts.
+# By default there's room for twice gunicorn's worker count (2 * CPUs + 1),
+# since the slots of recycled workers linger until they're reclaimed.
+_MIN_PROCESS_SLOTS = 64
+
+# Token buckets: username hash, tokens, last refill time
+_BUCKET = struct.Struct("=qdd")
+_BUCKET_PROBES = 4
+
+
+class AdmissionController():
+    """Enforces request limits across every process sharing it.
+
+    In-flight requests are counted per process, so that the slots of a
+    worker killed mid-request (e.g. by gunicorn's timeout) can be reclaimed
+    instead of leaking capacity forever.
+
+    A limit of 0 disables that limit.
+    """
+
+    def __init__(self, max_in_flight=0, endpoint_limits=None,
+                 rate=0, burst=0, user_slots=1024, process_slots=None):
+        """Initializes AdmissionController and its shared memory.
+
+        Args:
+            max_in_flight (optional): Maximum requests in flight overall.
+            endpoint_limits (optional): A dict mapping endpoint names to the
+                maximum requests in flight for that endpoint.
+            rate (optional): Requests per second each user may sustain.
+            burst (optional): Requests a user may make in a burst.
+                Defaults to rate.
+            user_slots (optional): Number of users whose buckets are tracked
+                at once; the least recently seen are evicted.
+            process_slots (optional): Number of processes whose requests
+                can be counted at once. Defaults to enough for every worker.
+        """
+
+        self.max_in_flight = max_in_flight
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.user_slots = user_slots
+        self.process_slots = process_slots or max(
+            _MIN_PROCESS_SLOTS, 2 * (2 * multiprocessing.cpu_count() + 1))
+
+        # Index of each capped endpoint's count; 0 is the global count
+        self._endpoint_names = sorted(self.endpoint_limits)
+        self._endpoints = {endpoint: i + 1
+                           for (i, endpoint) in enumerate(self._endpoint_names)}
+        self._process = struct.Struct("=q{}q".format(len(self._endpoints) + 1))
+        self._buckets_offset = self._process.size * self.process_slots
+
+        self._memory = mmap.mmap(-1, self._buckets_offset + _BUCKET.size * user_slots)
+
+        # An fcntl lock on a file shared the same way, since the kernel
+        # releases it if a worker is killed while holding it
+        self._lock_file = tempfile.TemporaryFile()
+        self._thread_lock = threading.Lock()  # fcntl locks don't exclude threads
+
+        self._slot = None
+        self._slot_pid = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates an AdmissionController from the [admission] and
+        [concurrency] config sections. Missing settings disable that limit.
+
+        Args:
+            config: A ConfigParser.
+        """
+
+        endpoint_limits = {}
+        if config.has_section("concurrency"):
+            endpoint_limits = {endpoint: int(limit)
+                               for (endpoint, limit) in config.items("concurrency")}
+
+        return cls(max_in_flight=config.getint("admission", "max_in_flight", fallback=0),
+                   endpoint_limits=endpoint_limits,
+                   rate=config.getfloat("admission", "rate", fallback=0),
+                   burst=config.getint("admission", "burst", fallback=0),
+                   user_slots=config.getint("admission", "user_slots", fallback=1024),
+                   process_slots=config.getint("admission", "process_slots", fallback=0))
+
+    @contextlib.contextmanager
+    def admit(self, endpoint):
+        """Context manager holding an in-flight slot for a request.
+
+        Args:
+            endpoint: The endpoint the request is for.
+
+        Raises:
+            AdmissionException: The server, or that endpoint, is at capacity,
+                or there are more processes than slots to count them in.
+        """
+
+        index = self._endpoints.get(endpoint)
+        if not self.max_in_flight and not index:
+            yield
+            return
+
+        with self._locked():
+            slot = self._own_slot()
+            totals = self._totals()
+            if self._over_capacity(totals, index):
+                # Maybe some of that load belongs to dead workers
+                self._reclaim_dead_slots()
+                totals = self._totals()
+                if self._over_capacity(totals, index):
+                    raise AdmissionException("503 Service Unavailable",
+                                             "Server is busy, try again shortly.",
+                                             retry_after=1)
+            self._add(slot, index, 1)
+
+        try:
+            yield
+        finally:
+            with self._locked():
+                self._add(slot, index, -1)
+
+    def check_rate(self, username):
+        """Takes a token from a user's bucket.
+
+        Args:
+            username: The authenticated user making a request.
+
+        Raises:
+            AdmissionException: The user has no tokens left.
+        """
+
+        if not self.rate:
+            return
+
+        key = struct.unpack("=q", hashlib.md5(username.encode("utf8")).digest()[:8])[0]
+        now = time.monotonic()
+
+        with self._locked():
+            offset = self._bucket_offset(key)
+            bucket_key, tokens, updated = _BUCKET.unpack_from(self._memory, offset)
+            if bucket_key != key:
+                tokens, updated = self.burst, now
+
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+            _BUCKET.pack_into(self._memory, offset, key, tokens, now)
+
+        if not admitted:
+            raise AdmissionException("429 Too Many Requests",
+                                     "Too many requests, slow down.",
+                                     retry_after=math.ceil((1 - tokens) / self.rate))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Context manager locking the counters against other processes."""
+
+        with self._thread_lock:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN)
+
+    def _bucket_offset(self, key):
+        """Finds the bucket for a key, or the one it should replace."""
+
+        first = key % self.user_slots
+        oldest = None
+        for probe in range(_BUCKET_PROBES):
+            offset = (self._buckets_offset +
+                      _BUCKET.size * ((first + probe) % self.user_slots))
+            bucket_key, _, updated = _BUCKET.unpack_from(self._memory, offset)
+            if bucket_key == key or not bucket_key:
+                return offset
+            if oldest is None or updated < oldest[1]:
+                oldest = (offset, updated)
+        return oldest[0]
+
+    def _own_slot(self):
+        """Finds (or claims) this process's in-flight slot."""
+
+        pid = os.getpid()
+        if self._slot_pid == pid:
+            return self._slot
+
+        slot = self._free_slot()
+        if slot is None:
+            self._reclaim_dead_slots()
+            slot = self._free_slot()
+            if slot is None:
+                raise AdmissionException("503 Service Unavailable",
+                                         "Server is busy, try again shortly.",
+                                         retry_after=1)
+
+        counts = [0] * (len(self._endpoints) + 1)
+        self._process.pack_into(self._memory, self._process.size * slot, pid, *counts)
+        self._slot, self._slot_pid = slot, pid
+        return slot
+
+    def _free_slot(self):
+        """Finds an unclaimed in-flight slot, or None if all are taken."""
+
+        for slot in range(self.process_slots):
+            if not self._process.unpack_from(self._memory, self._process.size * slot)[0]:
+                return slot
+        return None
+
+    def _totals(self):
+        """Sums in-flight counts over all processes."""
+
+        totals = [0] * (len(self._endpoints) + 1)
+        for slot in range(self.process_slots):
+            pid, *counts = self._process.unpack_from(self._memory, self._process.size * slot)
+            if pid:
+                totals = [total + count for (total, count) in zip(totals, counts)]
+        return totals
+
+    def _over_capacity(self, totals, index):
+        """Whether admitting one more request would exceed a limit."""
+
+        if self.max_in_flight and totals[0] >= self.max_in_flight:
+            return True
+        if index:
+            endpoint = self._endpoint_names[index - 1]
+            return totals[index] >= self.endpoint_limits[endpoint]
+        return False
+
+    def _add(self, slot, index, delta):
+        """Adjusts a process's global, and optionally endpoint, count."""
+
+        pid, *counts = self._process.unpack_from(self._memory, self._process.size * slot)
+        counts[0] += delta
+        if index:
+            counts[index] += delta
+        self._process.pack_into(self._memory, self._process.size * slot, pid, *counts)
+
+    def _reclaim_dead_slots(self):
+        """Frees the slots of processes that no longer exist."""
+
+        for slot in range(self.process_slots):
+            pid = self._process.unpack_from(self._memory, self._process.size * slot)[0]
+            if pid and not _process_exists(pid):
+                self._process.pack_into(self._memory, self._process.size * slot,
+                                        *[0] * (len(self._endpoints) + 2))
+
+
+def _process_exists(pid):
+    """Checks whether a process is running."""
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionException(Exception):
+    """Exception raised when a request is shed.
+
+    Attributes:
+        status: A full HTTP status code response as a string.
+        message: A string indicating why the request was shed.
+        retry_after: Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, status, message, retry_after):
+        """Initializes AdmissionException."""
+
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return self.status
@@ -0,0 +1,47 @@
+"""API for loading everything the frontend needs on page load."""
+
+from crud_controller import crud
+import database
+
+
+@crud.retrieve("bootstrap")
+def retrieve_bootstrap(*, user):
+    """Retrieves the session user, reference data and the first client's
+    feature requests in a single database round trip.
+
+    Returns:
+        A dict with the keys user, product_areas, clients and
+        feature_requests.
+    """
+
+    with database.connection.cursor() as cursor:
+        cursor.execute("""SELECT
+                              (SELECT coalesce(json_agg(product_areas ORDER BY _id), '[]')
+                               FROM (SELECT _id, name
+                                     FROM feature_request.product_areas
+                                    ) AS product_areas
+                              ) AS product_areas,
+
+                              (SELECT coalesce(json_agg(clients ORDER BY _id), '[]')
+                               FROM (SELECT _id, name
+                                     FROM feature_request.clients
+                                    ) AS clients
+                              ) AS clients,
+
+                              (SELECT coalesce(json_agg(requests ORDER BY client_priority), '[]')
+                               FROM (SELECT _id::text, title, description, client_id,
+                                         row_number() OVER (ORDER BY client_rank, _id)
+                                             AS client_priority,
+                                         target_date::text, ticket_url, product_area_id,
+                                         version
+                                     FROM feature_request.feature_requests
+                                     WHERE client_id = (SELECT min(_id)
+                                                        FROM feature_request.clients)
+                                    ) AS requests
+                              ) AS feature_requests
+                       """)
+        bootstrap = cursor.fetchone()
+
+    bootstrap["user"] = user
+
+    return bootstrap
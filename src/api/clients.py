@@ -29,5 +29,5 @@ def retrieve_client(_id: int):
                           FROM feature_request.clients
                           WHERE _id = %s
                        """,
-                       (id,))
+                       (_id,))
         return cursor.fetchone()
@@ -1,9 +1,98 @@
-"""CRUD API for managing feature requests."""
+"""CRUD API for managing feature requests.
+
+Feature requests are stored in order of a sparse client_rank, leaving gaps
+so a request can be moved by rewriting only its own rank. The API exposes
+dense 1..N client_priority values, computed when reading.
+
+The table is partitioned by client, so requests are changed at
+/feature_requests/<client_id>/<_id>: with the client, a write touches
+only that client's partition.
+"""
 
 import uuid
 
-from crud_controller import crud
+from crud_controller import crud, CRUDException
 import database
+from rows import Rows
+
+
+RANK_GAP = 65536  # spacing between ranks after rebalancing
+
+# Columns a partial update may change. Priority changes go through
+# update_feature_request_priority instead.
+PATCHABLE_FIELDS = ("title", "description", "client_id", "target_date",
+                    "ticket_url", "product_area_id")
+
+
+def _rank_for_priority(cursor, client_id, client_priority, _id=None):
+    """Chooses a rank placing a feature request at the given priority.
+
+    If there's no gap left between the neighbouring ranks, the client's
+    feature requests are rebalanced first. That's rare: RANK_GAP allows
+    many moves into the same spot before it happens.
+
+    Args:
+        cursor: The cursor to query with.
+        client_id: The ID of the client.
+        client_priority: The 1-based position to place the request at,
+            among the client's other requests.
+        _id (optional): The ID of the request being moved, if it exists.
+
+    Returns:
+        The rank, as an int.
+    """
+
+    params = {"client_id": client_id, "client_priority": client_priority, "_id": _id}
+
+    while True:
+        cursor.execute("""WITH others AS (
+                              SELECT client_rank,
+                                  row_number() OVER (ORDER BY client_rank, _id) AS position
+                              FROM feature_request.feature_requests
+                              WHERE client_id = %(client_id)s
+                                  AND _id IS DISTINCT FROM %(_id)s
+                          )
+                          SELECT max(client_rank) FILTER (WHERE position < %(client_priority)s)
+                                     AS lower,
+                                 min(client_rank) FILTER (WHERE position >= %(client_priority)s)
+                                     AS upper
+                          FROM others
+                       """,
+                       params)
+        neighbours = cursor.fetchone()
+        lower, upper = neighbours["lower"], neighbours["upper"]
+
+        if lower is None and upper is None:
+            return 0
+        elif lower is None:
+            return upper - RANK_GAP
+        elif upper is None:
+            return lower + RANK_GAP
+        elif upper - lower > 1:
+            return (lower + upper) // 2
+
+        _rebalance_ranks(cursor, client_id)
+
+
+def _rebalance_ranks(cursor, client_id):
+    """Spreads a client's ranks RANK_GAP apart, keeping their order.
+
+    Args:
+        cursor: The cursor to query with.
+        client_id: The ID of the client.
+    """
+
+    cursor.execute("""UPDATE feature_request.feature_requests AS requests
+                      SET client_rank = ranked.position * %(gap)s
+                      FROM (SELECT _id,
+                                row_number() OVER (ORDER BY client_rank, _id) AS position
+                            FROM feature_request.feature_requests
+                            WHERE client_id = %(client_id)s
+                           ) AS ranked
+                      WHERE requests.client_id = %(client_id)s
+                          AND requests._id = ranked._id
+                   """,
+                   {"client_id": client_id, "gap": RANK_GAP})
 
 
 @crud.create("feature_requests")
@@ -23,16 +112,20 @@ def create_feature_request(*, data):
 
     data["_id"] = str(uuid.uuid1())
     with database.connection.cursor() as cursor:
+        client_rank = _rank_for_priority(cursor, data["client_id"],
+                                         data["client_priority"])
         cursor.execute("""INSERT INTO feature_request.feature_requests
                               (_id, title, description, client_id,
-                               client_priority, target_date,
+                               client_rank, target_date,
                                ticket_url, product_area_id)
 
                           VALUES(%(_id)s, %(title)s, %(description)s, %(client_id)s,
-                                 %(client_priority)s, %(target_date)s,
+                                 %(client_rank)s, %(target_date)s,
                                  %(ticket_url)s, %(product_area_id)s)
+                          RETURNING version
                        """,
-                       data)
+                       dict(data, client_rank=client_rank))
+        data["version"] = cursor.fetchone()["version"]
 
     return data
 
@@ -41,15 +134,17 @@ def create_feature_request(*, data):
 def retrieve_feature_requests():
     """Retrieves all feature requests"""
 
-    with database.connection.cursor() as cursor:
+    with database.tuple_cursor() as cursor:
         cursor.execute("""SELECT _id::text, title, description, client_id,
-                              client_priority, target_date::text,
-                              ticket_url, product_area_id
+                              row_number() OVER (PARTITION BY client_id
+                                                 ORDER BY client_rank, _id)
+                                  AS client_priority,
+                              target_date::text, ticket_url, product_area_id, version
                           FROM feature_request.feature_requests
                           ORDER BY client_id, client_priority
                        """)
 
-        return cursor.fetchall()
+        return Rows.from_cursor(cursor)
 
 
 @crud.retrieve("feature_requests")
@@ -60,50 +155,147 @@ def retrieve_feature_requests_for_client(client_id: int):
         client_id: The ID of the client
     """
 
-    with database.connection.cursor() as cursor:
+    with database.tuple_cursor() as cursor:
         cursor.execute("""SELECT _id::text, title, description, client_id,
-                              client_priority, target_date::text,
-                              ticket_url, product_area_id
+                              row_number() OVER (ORDER BY client_rank, _id)
+                                  AS client_priority,
+                              target_date::text, ticket_url, product_area_id, version
                           FROM feature_request.feature_requests
                           WHERE client_id = %s
                           ORDER BY client_priority
                        """,
                        (client_id,))
 
-        return cursor.fetchall()
+        return Rows.from_cursor(cursor)
 
 
 @crud.update("feature_requests")
-def update_feature_request(_id, *, data):
+def update_feature_request(client_id: int, _id, *, data):
     """Updates a single feature request.
 
     Args:
+        client_id: The ID of the client the feature request belongs to,
+            before the update.
         _id: The ID of the feature request to update.
         data: A dict, the values of which will be used to update the
             feature request's values.
+
+    Raises:
+        CRUDException: The client has no such feature request.
     """
 
     data["_id"] = _id
     with database.connection.cursor() as cursor:
+        client_rank = _rank_for_priority(cursor, data["client_id"],
+                                         data["client_priority"], _id)
         cursor.execute("""UPDATE feature_request.feature_requests
                           SET title = %(title)s,
                               description = %(description)s,
                               client_id = %(client_id)s,
-                              client_priority = %(client_priority)s,
+                              client_rank = %(client_rank)s,
                               target_date = %(target_date)s,
                               ticket_url = %(ticket_url)s,
-                              product_area_id = %(product_area_id)s
-                          WHERE _id = %(_id)s
+                              product_area_id = %(product_area_id)s,
+                              version = version + 1
+                          WHERE client_id = %(current_client_id)s
+                              AND _id = %(_id)s
+                          RETURNING version
                        """,
-                       data)
+                       dict(data, client_rank=client_rank, current_client_id=client_id))
+        updated = cursor.fetchone()
+        if not updated:
+            raise CRUDException("404 Not Found",
+                                "Unknown feature request '{}'".format(_id))
+        data["version"] = updated["version"]
 
     return data
 
 
+@crud.patch("feature_requests")
+def patch_feature_request(client_id: int, _id, *, data):
+    """Updates only the given fields of a single feature request.
+
+    Only the supplied columns are written, so unchanged indexed columns
+    don't prevent a HOT update.
+
+    Args:
+        client_id: The ID of the client the feature request belongs to,
+            before the update.
+        _id: The ID of the feature request to update.
+        data: A dict of new values for any of PATCHABLE_FIELDS, optionally
+            with a 'version' key: the version the changes were based on.
+            If given and the request has since changed, nothing is updated.
+
+    Returns:
+        A dict of the changed fields, with the _id and new version.
+
+    Raises:
+        CRUDException: A field can't be updated, the feature request doesn't
+            exist, or it doesn't have the expected version.
+    """
+
+    fields = [field for field in PATCHABLE_FIELDS if field in data]
+
+    unknown = set(data) - set(PATCHABLE_FIELDS) - {"version"}
+    if unknown:
+        raise CRUDException("400 Bad Request",
+                            "Can't update '{}'".format("', '".join(sorted(unknown))))
+    if not fields:
+        raise CRUDException("400 Bad Request", "No fields to update.")
+
+    # Column names come from PATCHABLE_FIELDS, so are safe to format in
+    assignments = ", ".join("{0} = %({0})s".format(field) for field in fields)
+    if "client_id" in fields:
+        # Its rank means nothing among another client's requests, so it
+        # goes last there.
+        assignments += """, client_rank = (
+                              SELECT coalesce(max(client_rank) + {}, 0)
+                              FROM feature_request.feature_requests
+                              WHERE client_id = %(client_id)s
+                                  AND _id <> %(_id)s
+                          )""".format(RANK_GAP)
+    precondition = "AND version = %(version)s" if "version" in data else ""
+
+    with database.connection.cursor() as cursor:
+        cursor.execute("""UPDATE feature_request.feature_requests
+                          SET {}, version = version + 1
+                          WHERE client_id = %(current_client_id)s
+                              AND _id = %(_id)s
+                              {}
+                          RETURNING version
+                       """.format(assignments, precondition),
+                       dict(data, _id=_id, current_client_id=client_id))
+        updated = cursor.fetchone()
+
+        if not updated:
+            cursor.execute("""SELECT version
+                              FROM feature_request.feature_requests
+                              WHERE client_id = %s
+                                  AND _id = %s
+                           """,
+                           (client_id, _id))
+            current = cursor.fetchone()
+            if not current:
+                raise CRUDException("404 Not Found",
+                                    "Unknown feature request '{}'".format(_id))
+            raise CRUDException("412 Precondition Failed",
+                                "Feature request was changed by someone else "
+                                "(now version {}).".format(current["version"]))
+
+    changes = {field: data[field] for field in fields}
+    changes["_id"] = _id
+    changes["version"] = updated["version"]
+
+    return changes
+
+
 @crud.update("feature_requests_priority")
 def update_feature_request_priority(_id, *, data):
     """Updates the priority of a single feature request.
 
+    Only the moved request is written; the requests after it keep their
+    ranks, and so shift down a priority implicitly.
+
     Args:
         _id: The ID of the feature request to update.
         data: A dict containing the key 'client_priority'
@@ -111,26 +303,43 @@ def update_feature_request_priority(_id, *, data):
 
     data["_id"] = _id
     with database.connection.cursor() as cursor:
+        cursor.execute("""SELECT client_id
+                          FROM feature_request.feature_requests
+                          WHERE _id = %s
+                       """,
+                       (_id,))
+        feature_request = cursor.fetchone()
+        if not feature_request:
+            raise CRUDException("404 Not Found",
+                                "Unknown feature request '{}'".format(_id))
+
+        client_rank = _rank_for_priority(cursor, feature_request["client_id"],
+                                         data["client_priority"], _id)
+
+        # Include client_id so only that client's partition is touched
         cursor.execute("""UPDATE feature_request.feature_requests
-                          SET client_priority = %(client_priority)s
-                          WHERE _id = %(_id)s
+                          SET client_rank = %s
+                          WHERE client_id = %s
+                              AND _id = %s
                        """,
-                       data)
+                       (client_rank, feature_request["client_id"], _id))
 
     return data
 
 
 @crud.delete("feature_requests")
-def delete_feature_request(_id):
+def delete_feature_request(client_id: int, _id):
     """Deletes a single feature request.
 
     Args:
+        client_id: The ID of the client the feature request belongs to.
         _id: The ID of the feature request to delete.
     """
 
     with database.connection.cursor() as cursor:
         cursor.execute("""DELETE
                           FROM feature_request.feature_requests
-                          WHERE _id = %s
+                          WHERE client_id = %s
+                              AND _id = %s
                        """,
-                       (_id,))
+                       (client_id, _id))
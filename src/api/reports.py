@@ -0,0 +1,99 @@
+"""API for reporting on feature requests.
+
+Reports are served from feature_request.feature_request_counts, a summary
+table kept in step with feature_requests by triggers, so their cost depends
+on the number of distinct clients, product areas and target dates rather
+than the number of feature requests.
+"""
+
+from crud_controller import crud, CRUDException
+import database
+
+
+REPORTS = {
+    "clients": """SELECT clients._id AS client_id, clients.name,
+                      coalesce(sum(request_count), 0) AS open,
+                      coalesce(sum(request_count)
+                                   FILTER (WHERE target_date < current_date),
+                               0) AS overdue
+                  FROM feature_request.clients
+                  LEFT JOIN feature_request.feature_request_counts AS counts
+                      ON counts.client_id = clients._id
+                  GROUP BY clients._id
+                  ORDER BY clients._id
+               """,
+
+    "product_areas": """SELECT product_areas._id AS product_area_id, product_areas.name,
+                            coalesce(sum(request_count), 0) AS open,
+                            coalesce(sum(request_count)
+                                         FILTER (WHERE target_date < current_date),
+                                     0) AS overdue
+                        FROM feature_request.product_areas
+                        LEFT JOIN feature_request.feature_request_counts AS counts
+                            ON counts.product_area_id = product_areas._id
+                        GROUP BY product_areas._id
+                        ORDER BY product_areas._id
+                     """,
+
+    "target_months": """SELECT to_char(target_date, 'YYYY-MM') AS month,
+                            sum(request_count) AS open,
+                            coalesce(sum(request_count)
+                                         FILTER (WHERE target_date < current_date),
+                                     0) AS overdue
+                        FROM feature_request.feature_request_counts
+                        WHERE request_count > 0
+                        GROUP BY month
+                        ORDER BY month
+                     """,
+}
+
+
+@crud.retrieve("reports")
+def retrieve_report(name):
+    """Retrieves a report of open and overdue feature request counts.
+
+    Args:
+        name: The report to retrieve: "clients", "product_areas" or
+            "target_months".
+
+    Returns:
+        A dict with the keys:
+            refreshed: When the summary was last rebuilt from scratch.
+                Triggers keep it current in between; rebuilding only
+                corrects drift from writes that bypassed them.
+            as_of: The time the report was generated.
+            rows: The report's rows.
+    """
+
+    if name not in REPORTS:
+        raise CRUDException("404 Not Found",
+                            "Unknown report '{}'".format(name))
+
+    with database.connection.cursor() as cursor:
+        cursor.execute("""SELECT refreshed::text, now()::text AS as_of,
+                              (SELECT coalesce(json_agg(report), '[]')
+                               FROM ({}) AS report
+                              ) AS rows
+                          FROM feature_request.report_refreshes
+                       """.format(REPORTS[name]))
+
+        return cursor.fetchone()
+
+
+@crud.create("reports_refresh")
+def refresh_reports(*, user):
+    """Rebuilds the report summary from the feature requests table.
+
+    Blocks writes to feature requests while it runs. Administrators only.
+    """
+
+    if not user["administrator"]:
+        raise CRUDException("403 Forbidden",
+                            "Only administrators may refresh reports.")
+
+    with database.connection.cursor() as cursor:
+        cursor.execute("""SELECT feature_request.refresh_feature_request_counts()::text
+                              AS refreshed
+                       """)
+
+        return cursor.fetchone()
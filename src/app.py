@@ -1,18 +1,49 @@
+import hashlib
 import http.cookies
 import json
 
+from admission import AdmissionException
 from authentication import AuthenticationException
 from crud_controller import crud, CRUDException
+import database
 
-import api.clients
-import api.feature_requests
-import api.login
-import api.product_areas
+
+def create_app(config=None):
+    """Creates the WSGI application.
+
+    Loads configuration and registers the API endpoints, but doesn't connect
+    to the database: each process connects on its first request (or from
+    gunicorn's post_fork hook), so the app is safe to preload before forking.
+
+    Args:
+        config (optional): A ConfigParser. If omitted, the default config
+            file is read.
+
+    Returns:
+        The WSGI handler.
+    """
+
+    if config is None:
+        config = database.load_config()
+    database.configure(config)
+    crud.configure(config)
+
+    # Imported for their side effect of registering API methods
+    import api.bootstrap
+    import api.clients
+    import api.feature_requests
+    import api.login
+    import api.product_areas
+    import api.reports
+
+    return app
 
 
 def app(environ, start_response):
     """WSGI handler that delegates to our CRUD controller."""
 
+    database.connect()
+
     method = environ["REQUEST_METHOD"].upper()
     path = environ["PATH_INFO"]
     cookie = http.cookies.SimpleCookie(environ.get("HTTP_COOKIE"))
@@ -28,6 +59,8 @@ def app(environ, start_response):
     else:
         data = None
 
+    headers = [("Content-Type", "application/json")]
+
     try:
         response = crud.handle(method, path, data, cookie)
         status = "200 OK"
@@ -43,16 +76,35 @@ def app(environ, start_response):
                                "message": err.message})
         status = "401 Unauthorized"
 
+    except AdmissionException as err:
+        # Shed load quickly rather than queueing it
+        response = json.dumps({"status": "ERR",
+                               "message": err.message})
+        status = err.status
+        headers.append(("Retry-After", str(err.retry_after)))
+
     except Exception as err:
         # Any unexpected error and we give a generic Internal Server Error
         response = json.dumps({"status": "ERR",
                                "message": str(err)})
         status = "500 Internal Server Error"
 
-    headers = [
-        ("Content-Type", "application/json"),
-        ("Content-Length", str(len(response)))
-    ]
+    body = bytes(response, "utf-8")
+
+    if method == "GET" and status == "200 OK":
+        # Responses depend on the session cookie, so only the user's own
+        # browser may cache them, revalidating with the ETag each time.
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        headers += [
+            ("Cache-Control", "private, no-cache"),
+            ("Vary", "Cookie"),
+            ("ETag", etag)
+        ]
+        if environ.get("HTTP_IF_NONE_MATCH") == etag:
+            status = "304 Not Modified"
+            body = b""
+
+    headers.append(("Content-Length", str(len(body))))
 
     start_response(status, headers)
-    return [bytes(response, "utf-8")]
+    return [body]
@@ -0,0 +1,247 @@
+"""Cache shared between worker processes through a memory-mapped file.
+
+Every worker on a host maps the same file (by default on /dev/shm, so it
+lives in memory), so an entry cached by one worker is a hit for all of them
+and survives workers being recycled.
+
+The file is divided into fixed-size slots, grouped into small sets. A key
+hashes to one set and may occupy any slot in it; when the set is full, the
+least recently used slot is evicted. Reads take no locks: each slot has a
+sequence number that writers make odd while they write, so a reader that
+sees it odd, or changed after reading, knows to retry. Writers lock only
+the set they're writing to.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+_MAGIC = b"FRCACHE1"
+_HEADER = struct.Struct("=8sII")  # magic, slot count, slot size
+
+# Sequence number, key digest, expiry time, last access time, value length
+_SLOT = struct.Struct("=Q16sddI")
+
+_WAYS = 8  # slots per set
+_READ_ATTEMPTS = 4
+
+
+class SharedCache():
+    """A bytes-to-bytes cache with TTLs and LRU eviction, shared between
+    every process that opens the same file.
+
+    Values larger than a slot aren't cached.
+    """
+
+    def __init__(self, path, slots=1024, slot_size=65536):
+        """Opens (or creates) the cache file and maps it.
+
+        The layout is part of the file's name, so caches opened with
+        different layouts (e.g. by old and new masters during an upgrade)
+        use separate files. A file is never resized or cleared while
+        mapped: one with an unexpected header is replaced by a new file.
+
+        Args:
+            path: The path of the cache file, to which the layout is added.
+            slots (optional): Number of slots; rounded up to a whole set.
+            slot_size (optional): Bytes per slot, including its header.
+        """
+
+        self.slots = -(-slots // _WAYS) * _WAYS
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT.size
+        self.path = "{}.{}x{}".format(path, self.slots, slot_size)
+        self._sets = self.slots // _WAYS
+        self._size = _HEADER.size + self.slots * slot_size
+        self._header = (_MAGIC, self.slots, slot_size)
+        self._write_lock = threading.Lock()  # fcntl locks don't exclude threads
+
+        self._fd = self._open_locked()
+        try:
+            size = os.fstat(self._fd).st_size
+            if not size:
+                os.ftruncate(self._fd, self._size)  # new, so not yet mapped
+            if size in (0, self._size):
+                self._memory = mmap.mmap(self._fd, self._size)
+                header = _HEADER.unpack_from(self._memory)
+                if header == (bytes(len(_MAGIC)), 0, 0):
+                    _HEADER.pack_into(self._memory, 0, *self._header)
+                    header = self._header
+
+            if size not in (0, self._size) or header != self._header:
+                self._replace()
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _HEADER.size, 0)
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a SharedCache from the [cache] config section.
+
+        Args:
+            config: A ConfigParser.
+        """
+
+        return cls(config.get("cache", "path", fallback="/dev/shm/feature-request.cache"),
+                   slots=config.getint("cache", "slots", fallback=1024),
+                   slot_size=config.getint("cache", "slot_size", fallback=65536))
+
+    def get(self, key):
+        """Looks up a cached value.
+
+        Args:
+            key: A str key.
+
+        Returns:
+            The value as bytes, or None if it isn't cached or has expired.
+        """
+
+        digest = _digest(key)
+        now = time.time()
+
+        for offset in self._set_offsets(digest):
+            for _ in range(_READ_ATTEMPTS):
+                seq, slot_digest, expires, _, length = _SLOT.unpack_from(self._memory, offset)
+                if seq % 2:
+                    continue  # being written
+
+                if slot_digest != digest:
+                    break
+                start = offset + _SLOT.size
+                value = self._memory[start:start + length]
+
+                if _SLOT.unpack_from(self._memory, offset)[0] != seq:
+                    continue  # changed while we read it
+                if expires <= now:
+                    return None
+
+                # Unlocked, but a lost update only makes eviction less exact
+                struct.pack_into("=d", self._memory, offset + 32, now)
+                return value
+
+        return None
+
+    def set(self, key, value, ttl):
+        """Caches a value, evicting the least recently used entry in its
+        set if necessary.
+
+        Args:
+            key: A str key.
+            value: The value, as bytes.
+            ttl: Seconds until the value expires.
+        """
+
+        if len(value) > self.capacity:
+            return
+
+        digest = _digest(key)
+        now = time.time()
+
+        with self._locked_set(digest) as offsets:
+            # Replace the key's own slot if it has one, else a free (or
+            # expired) slot, else the least recently used.
+            free = None
+            in_use = []
+            for offset in offsets:
+                seq, slot_digest, expires, accessed, _ = _SLOT.unpack_from(self._memory, offset)
+                if slot_digest == digest:
+                    free = (offset, seq)
+                    break
+                if expires <= now:
+                    free = free or (offset, seq)
+                else:
+                    in_use.append((accessed, offset, seq))
+
+            offset, seq = free or min(in_use)[1:]
+            self._write(offset, seq, digest, now + ttl, now, value)
+
+    def delete(self, key):
+        """Removes a value, if cached.
+
+        Args:
+            key: A str key.
+        """
+
+        digest = _digest(key)
+
+        with self._locked_set(digest) as offsets:
+            for offset in offsets:
+                seq, slot_digest, _, _, _ = _SLOT.unpack_from(self._memory, offset)
+                if slot_digest == digest:
+                    self._write(offset, seq, bytes(16), 0, 0, b"")
+
+    def _write(self, offset, seq, digest, expires, accessed, value):
+        """Overwrites a slot, making its sequence number odd meanwhile."""
+
+        struct.pack_into("=Q", self._memory, offset, seq + 1)
+        start = offset + _SLOT.size
+        self._memory[start:start + len(value)] = value
+        _SLOT.pack_into(self._memory, offset,
+                        seq + 1, digest, expires, accessed, len(value))
+        struct.pack_into("=Q", self._memory, offset, seq + 2)
+
+    def _open_locked(self):
+        """Opens the cache file, holding the lock on its header."""
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER.size, 0)
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)  # replaced while we waited for the lock
+
+    def _replace(self):
+        """Replaces the cache file with a new, empty one.
+
+        Processes that mapped the old file keep using it until they reopen
+        the cache. Called holding the lock on the old file's header.
+        """
+
+        temporary = "{}.{}".format(self.path, os.getpid())
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(fd, self._size)
+        memory = mmap.mmap(fd, self._size)
+        _HEADER.pack_into(memory, 0, *self._header)
+        os.rename(temporary, self.path)
+
+        if hasattr(self, "_memory"):
+            self._memory.close()
+        os.close(self._fd)
+        self._fd, self._memory = fd, memory
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _HEADER.size, 0)
+
+    def _set_offsets(self, digest):
+        """Returns the offsets of the slots in a digest's set."""
+
+        first = (int.from_bytes(digest[:8], "little") % self._sets) * _WAYS
+        return [_HEADER.size + (first + way) * self.slot_size for way in range(_WAYS)]
+
+    @contextlib.contextmanager
+    def _locked_set(self, digest):
+        """Context manager locking a digest's set against other writers.
+
+        Yields:
+            The offsets of the slots in the set.
+        """
+
+        offsets = self._set_offsets(digest)
+        with self._write_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size * _WAYS, offsets[0])
+            try:
+                yield offsets
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size * _WAYS, offsets[0])
+
+
+def _digest(key):
+    """Hashes a key to the 16 bytes stored in its slot."""
+
+    return hashlib.md5(key.encode("utf8")).digest()
@@ -11,14 +11,18 @@ import inspect
 import json
 import urllib.parse
 
+import admission
 import authentication
+import cache
+import database
+from rows import Rows
 
 
 class _CRUDController():
     """Dispatches HTTP requests to defined CRUD actions.
 
     Usage:
-        create, retrieve, update, and delete methods are used to register
+        create, retrieve, update, patch, and delete methods are used to register
         a function to an API endpoint.
         Each can take any number of positional arguments corresponding to
         the number of path segments in the URL it expects. Args may be
@@ -46,14 +50,48 @@ class _CRUDController():
     """
 
     def __init__(self):
-        """Initializes controller's method registry"""
+        """Initializes controller's method registry, with admission control,
+        deadlines and caching disabled."""
 
         self._registry = {
             "PUT": {},
+            "PATCH": {},
             "GET": {},
             "POST": {},
             "DELETE": {}
         }
+        self.admission = admission.AdmissionController()
+        self.deadlines = {}
+        self.cache = None
+        self.cache_ttl = {}
+
+    def configure(self, config):
+        """Applies settings from the app config.
+
+        Must be called before worker processes are forked for admission
+        limits to be shared between them.
+
+        Args:
+            config: A ConfigParser.
+        """
+
+        self.admission = admission.AdmissionController.from_config(config)
+
+        # Seconds each endpoint's requests may take, with a "default"
+        self.deadlines = {}
+        if config.has_section("deadlines"):
+            self.deadlines = {endpoint: config.getfloat("deadlines", endpoint)
+                              for endpoint in config.options("deadlines")}
+
+        # Seconds each endpoint's GET responses may be cached for. Cached
+        # responses are shared by all users, so only list endpoints whose
+        # responses don't depend on the user.
+        self.cache = None
+        self.cache_ttl = {}
+        if config.has_section("cache_ttl"):
+            self.cache = cache.SharedCache.from_config(config)
+            self.cache_ttl = {endpoint: config.getfloat("cache_ttl", endpoint)
+                              for endpoint in config.options("cache_ttl")}
 
     def _register(self, method, endpoint, requires_authn):
         """Registers a CRUD function.
@@ -62,7 +100,7 @@ class _CRUDController():
         HTTP method, URL endpoint, and required parameters.
 
         Args:
-            method: An HTTP method: POST, GET, PUT, or DELETE.
+            method: An HTTP method: POST, GET, PUT, PATCH, or DELETE.
             endpoint: The base of the URL to register.
             requires_authn: If True (default), requires a valid session cookie
                 when calling the API.
@@ -95,6 +133,11 @@ class _CRUDController():
         return self._register("PUT", endpoint,
                               requires_authn=requires_authn)
 
+    def patch(self, endpoint, requires_authn=True):
+        """Registers a partial update endpoint."""
+        return self._register("PATCH", endpoint,
+                              requires_authn=requires_authn)
+
     def delete(self, endpoint, requires_authn=True):
         """Registers a delete endpoint."""
         return self._register("DELETE", endpoint,
@@ -107,8 +150,8 @@ class _CRUDController():
         Args:
             method: An HTTP method: POST, GET, etc.
             path: The URL path segment
-            data: For POST and PUT (create/update) endpoints, the JSON document
-                with which to create or replace the resource.
+            data: For POST, PUT and PATCH (create/update) endpoints, the JSON
+                document with which to create, replace or modify the resource.
             cookie: An http.cookies Cookie, if the user sent one.
 
         Returns:
@@ -118,6 +161,8 @@ class _CRUDController():
             CRUDException: An error occurred accessing that resource.
             AuthenticationException: A request was made for a secure resource
                 without a valid session token.
+            AdmissionException: The request was shed due to load or
+                rate limiting.
         """
 
         _, endpoint, *args = path.split("/")
@@ -132,6 +177,40 @@ class _CRUDController():
 
         function, spec, requires_authn = self._registry[method][endpoint, len(args)]
 
+        deadline = self.deadlines.get(endpoint, self.deadlines.get("default"))
+        cache_ttl = self.cache_ttl.get(endpoint) if method == "GET" else None
+
+        with self.admission.admit(endpoint):
+            database.set_deadline(deadline)
+            try:
+                return self._call(function, spec, requires_authn, args, data, cookie,
+                                  cache_key=path if cache_ttl else None,
+                                  cache_ttl=cache_ttl)
+            except database.DeadlineExceeded:
+                raise CRUDException("504 Gateway Timeout",
+                                    "Request took longer than {}s.".format(deadline))
+            finally:
+                database.clear_deadline()
+
+    def _call(self, function, spec, requires_authn, args, data, cookie,
+              cache_key=None, cache_ttl=None):
+        """Authenticates a request and calls the API method handling it.
+
+        Args:
+            function: The API method.
+            spec: The API method's argspec.
+            requires_authn: Whether the API method requires a valid session.
+            args: The path segments to pass as positional args.
+            data: The request's JSON document, if any.
+            cookie: An http.cookies Cookie, if the user sent one.
+            cache_key (optional): If given, the response is served from and
+                stored in the shared cache under this key.
+            cache_ttl (optional): Seconds to cache the response for.
+
+        Returns:
+            A str or bytes content for the response.
+        """
+
         if cookie and "session" in cookie:
             token = urllib.parse.unquote(cookie["session"].value)
             try:
@@ -145,6 +224,14 @@ class _CRUDController():
         if requires_authn and not user:
             raise authentication.AuthenticationException("Authentication required.")
 
+        if user:
+            self.admission.check_rate(user["username"])
+
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached.decode("utf8")
+
         # Coerce all args to the required type, if the API method function
         # has corresponding annotations.
         args = [spec.annotations.get(name, str)(arg)
@@ -159,7 +246,15 @@ class _CRUDController():
 
         response = function(*args, **kwargs)
 
-        return json.dumps(response if response is not None else {"status": "OK"})
+        if isinstance(response, Rows):
+            response = response.to_json()
+        else:
+            response = json.dumps(response if response is not None else {"status": "OK"})
+
+        if cache_key:
+            self.cache.set(cache_key, response.encode("utf8"), cache_ttl)
+
+        return response
 
 
 class CRUDException(Exception):
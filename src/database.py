@@ -1,23 +1,210 @@
-"""Database connection manager"""
+"""Database connection manager
+
+The connection is opened lazily, once per process, rather than at import
+time. This lets the application be imported (and preloaded by gunicorn)
+before worker processes are forked, without the workers sharing a socket.
+
+While a deadline is set, every statement runs with a statement_timeout of
+the time remaining, so Postgres cancels it rather than letting it outlive
+the request.
+
+Attributes:
+    config: The ConfigParser used to open connections.
+    connection: This process's connection, or None until connect() is called.
+"""
 
 import configparser
+import os
+import time
+
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 
 
-config = configparser.ConfigParser()
-config.read("../config/config.cfg")
+DEFAULT_CONFIG_PATH = "../config/config.cfg"
+
+config = None
+connection = None
+
+_connection_pid = None
+_inherited_connections = []
+
+_deadline = None
+
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """Reads the application config file.
+
+    Args:
+        path (optional): The path of the config file.
+
+    Returns:
+        A ConfigParser holding the file's settings.
+    """
+
+    new_config = configparser.ConfigParser()
+    new_config.read(path)
+    return new_config
+
+
+def configure(new_config):
+    """Sets the config used to open connections, without connecting.
+
+    Args:
+        new_config: A ConfigParser with a [database] section.
+    """
+
+    global config
+    config = new_config
+
+
+def connect():
+    """Opens this process's database connection, if it isn't open already.
+
+    Cheap enough to call at the start of every request. A connection
+    inherited from a parent process across fork() is never reused.
+
+    Returns:
+        The connection.
+    """
+
+    global config, connection, _connection_pid
+
+    if connection is not None:
+        if _connection_pid == os.getpid():
+            return connection
+
+        # The inherited connection's socket belongs to the parent. Closing
+        # it (even implicitly, by garbage collection) would terminate the
+        # parent's session, so just keep a reference and leave it alone.
+        _inherited_connections.append(connection)
+
+    if config is None:
+        config = load_config()
+
+    connection = psycopg2.connect(
+        host=config.get("database", "host"),
+        port=config.get("database", "port", fallback=5432),
+        database=config.get("database", "database"),
+        user=config.get("database", "username"),
+        password=config.get("database", "password"),
+
+        connection_factory=_Connection,
+
+        # Return results as dict
+        cursor_factory=DictCursor,
+    )
+
+    # No need for transactions in this app
+    connection.set_session(autocommit=True)
+
+    _connection_pid = os.getpid()
+
+    return connection
+
+
+def tuple_cursor():
+    """Opens a cursor returning rows as plain tuples, rather than dicts.
+
+    Cheaper for large listings; wrap results with rows.Rows.from_cursor().
+
+    Returns:
+        The cursor.
+    """
+
+    return connection.cursor(cursor_factory=TupleCursor)
+
+
+def set_deadline(seconds):
+    """Sets a deadline for all statements executed from now on.
+
+    Args:
+        seconds: Time allowed from now, or None for no deadline.
+    """
+
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds else None
+
+
+def clear_deadline():
+    """Removes any deadline. Statements may run for as long as they need."""
+
+    set_deadline(None)
+
+
+def _statement_timeout():
+    """Returns the statement_timeout, in ms, to run the next statement with.
+
+    Raises:
+        DeadlineExceeded: The deadline has already passed.
+    """
+
+    if _deadline is None:
+        return 0
+
+    remaining = _deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return max(int(remaining * 1000), 1)
+
+
+class _Connection(psycopg2.extensions.connection):
+    """Connection that remembers the statement_timeout last set on it.
+
+    Attributes:
+        statement_timeout: The session's statement_timeout in ms, or None if
+            unknown (a failed statement may have rolled back setting it).
+    """
+
+    statement_timeout = 0
+
+
+class _DeadlineCursorMixin():
+    """Runs each statement with the time left before the deadline.
+
+    Before PostgreSQL 13, a query string runs under the statement_timeout
+    in force when it started, so a SET only applies to statements after it
+    in the same string if no timeout was in force. Only then is the SET
+    sent with the statement; otherwise it costs a round trip of its own.
+    """
+
+    def execute(self, query, vars=None):
+        timeout = _statement_timeout()
+
+        try:
+            if timeout != self.connection.statement_timeout:
+                set_timeout = "SET statement_timeout = {}".format(timeout)
+                if self.connection.statement_timeout == 0:
+                    query = "{};\n{}".format(set_timeout, query)
+                else:
+                    super().execute(set_timeout)
+                    self.connection.statement_timeout = timeout
+
+            super().execute(query, vars)
+        except psycopg2.extensions.QueryCanceledError:
+            self.connection.statement_timeout = None
+            if _deadline is not None:
+                raise DeadlineExceeded()
+            raise
+        except Exception:
+            self.connection.statement_timeout = None
+            raise
+
+        self.connection.statement_timeout = timeout
+
+
+class DictCursor(_DeadlineCursorMixin, psycopg2.extras.RealDictCursor):
+    """Cursor returning rows as dicts. The default."""
+
+
+class TupleCursor(_DeadlineCursorMixin, psycopg2.extensions.cursor):
+    """Cursor returning rows as tuples."""
 
-connection = psycopg2.connect(
-    host=config.get("database", "host"),
-    port=config.get("database", "port", fallback=5432),
-    database=config.get("database", "database"),
-    user=config.get("database", "username"),
-    password=config.get("database", "password"),
 
-    # Return results as dict
-    cursor_factory=psycopg2.extras.RealDictCursor,
-)
+class DeadlineExceeded(Exception):
+    """Exception raised when a statement is run or cancelled because the
+    deadline has passed."""
 
-# No need for transactions in this app
-connection.set_session(autocommit=True)
+    def __str__(self):
+        return "Deadline exceeded"
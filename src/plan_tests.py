@@ -0,0 +1,429 @@
+#!/usr/bin/python3
+"""Query plan regression tests.
+
+Seeds the database at production-like scale, runs each data access function
+in authentication.py and api/*, recording the SQL they execute, then checks
+EXPLAIN (FORMAT JSON) of every statement recorded:
+
+    * Large tables are only sequentially scanned where that's expected.
+    * Client-scoped statements are pruned to one partition.
+    * Row estimates stay within bounds.
+    * The plan's shape matches the fingerprint recorded in
+      plan_fingerprints.json. Statements without one fail. To record new
+      statements or accept intended plan changes, run with
+      UPDATE_PLAN_FINGERPRINTS=1 and commit the updated file. This check
+      only runs on, and only records with, the PostgreSQL version CI runs.
+
+Usage:
+    python plan_tests.py
+"""
+
+import hashlib
+import json
+import os
+import re
+import unittest
+import unittest.mock
+import uuid
+
+import bcrypt
+
+import api.bootstrap
+import api.clients
+import api.feature_requests
+import api.product_areas
+import api.reports
+import app
+import authentication
+import database
+
+
+app.create_app()
+database.connect()
+
+
+FINGERPRINTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "plan_fingerprints.json")
+
+# Plan shapes differ between PostgreSQL major versions (e.g. UPDATE on a
+# partitioned table has a subplan per partition on 11, but a single Append
+# from 14), so the fingerprints are tied to the version CI runs, pinned in
+# .travis.yml. Record them against that version, and update both together.
+FINGERPRINTS_SERVER_VERSION = 11
+
+CLIENTS = range(2000, 2200)
+PRODUCT_AREAS = range(2000, 2004)
+REQUESTS_PER_CLIENT = 500
+USERS = 10000
+
+USERNAME = "__plan_login"
+PASSWORD = "plan_pass"
+
+# Tables small enough that scanning them whole is fine at any scale. The
+# default partition is normally empty.
+SMALL_TABLES = {"clients", "product_areas", "feature_request_counts", "report_refreshes",
+                "feature_requests_default"}
+
+
+def request_id(client_id, n):
+    """Returns the ID the seed data gives a client's nth feature request."""
+
+    return str(uuid.UUID(hashlib.md5("{}-{}".format(client_id, n).encode()).hexdigest()))
+
+
+def request_data(**values):
+    """Returns a complete feature request document for the first client."""
+
+    data = {"title": "Plan request",
+            "description": "",
+            "client_id": CLIENTS[0],
+            "client_priority": 1,
+            "target_date": "2016-01-01",
+            "ticket_url": None,
+            "product_area_id": PRODUCT_AREAS[0]}
+    data.update(values)
+    return data
+
+
+class _RecordingCursorMixin():
+    """Records every statement executed, with its parameters filled in."""
+
+    statements = []
+
+    def execute(self, query, vars=None):
+        self.statements.append(self.mogrify(query, vars).decode("utf8"))
+        super().execute(query, vars)
+
+
+class RecordingDictCursor(_RecordingCursorMixin, database.DictCursor):
+    pass
+
+
+class RecordingTupleCursor(_RecordingCursorMixin, database.TupleCursor):
+    pass
+
+
+# Each scenario calls one data access function as the app would.
+# Expectations are a dict applied to every statement the scenario executes,
+# or a list with a dict for each statement, in the order they execute:
+#     max_rows: Upper bound on the estimated rows returned. Lookups by
+#         feature request ID alone estimate a row per partition, so have none.
+#     partitions: Maximum client partitions of feature_requests the plan may
+#         touch. The default partition isn't counted: on PostgreSQL 11,
+#         UPDATE and DELETE prune by constraint exclusion, which can't rule
+#         it out once there are more than 100 clients. It's normally empty.
+#     client_scoped: The statement reads only one client's requests, so
+#         sequentially scanning that client's partition is fine.
+#     full_scan: The statement reads whole tables by design.
+SCENARIOS = [
+    ("get_user_for_login",
+     lambda context: authentication.get_user_for_login(USERNAME, PASSWORD),
+     {"max_rows": 1}),
+
+    ("create_session_for_user",
+     lambda context: context.update(
+         token=authentication.create_session_for_user(USERNAME)),
+     {"max_rows": 1}),
+
+    ("get_user_for_session",
+     lambda context: context.update(
+         user=authentication.get_user_for_session(context["token"])),
+     {"max_rows": 1}),
+
+    ("destroy_session_for_user",
+     lambda context: authentication.destroy_session_for_user(USERNAME),
+     {"max_rows": 1}),
+
+    ("retrieve_clients",
+     lambda context: api.clients.retrieve_clients(),
+     {"max_rows": 1000}),
+
+    ("retrieve_client",
+     lambda context: api.clients.retrieve_client(CLIENTS[0]),
+     {"max_rows": 1}),
+
+    ("retrieve_product_areas",
+     lambda context: api.product_areas.retrieve_product_areas(),
+     {"max_rows": 1000}),
+
+    ("retrieve_bootstrap",
+     lambda context: api.bootstrap.retrieve_bootstrap(user=context["user"]),
+     {"max_rows": 1, "client_scoped": True}),
+
+    ("retrieve_feature_requests",
+     lambda context: api.feature_requests.retrieve_feature_requests(),
+     {"full_scan": True}),
+
+    ("retrieve_feature_requests_for_client",
+     lambda context: api.feature_requests.retrieve_feature_requests_for_client(CLIENTS[0]),
+     {"max_rows": 5 * REQUESTS_PER_CLIENT, "partitions": 1, "client_scoped": True}),
+
+    ("create_feature_request",
+     lambda context: context.update(
+         created=api.feature_requests.create_feature_request(data=request_data())),
+     {"max_rows": 1, "partitions": 1, "client_scoped": True}),
+
+    ("update_feature_request",
+     lambda context: api.feature_requests.update_feature_request(
+         CLIENTS[0], context["created"]["_id"], data=request_data(title="Updated")),
+     [{"max_rows": 1, "partitions": 1, "client_scoped": True},  # rank
+      {"partitions": 1}]),  # update by client and ID
+
+    ("patch_feature_request",
+     lambda context: api.feature_requests.patch_feature_request(
+         CLIENTS[0], context["created"]["_id"], data={"title": "Patched", "version": 2}),
+     {"partitions": 1}),
+
+    ("update_feature_request_priority",
+     lambda context: api.feature_requests.update_feature_request_priority(
+         request_id(CLIENTS[0], 1), data={"client_priority": REQUESTS_PER_CLIENT // 2}),
+     [{},  # client lookup by ID
+      {"max_rows": 1, "partitions": 1, "client_scoped": True},  # rank
+      {"partitions": 1}]),  # update by client and ID
+
+    ("rebalance_ranks",
+     lambda context: api.feature_requests._rebalance_ranks(
+         database.connection.cursor(), CLIENTS[0]),
+     {"partitions": 1, "client_scoped": True}),
+
+    ("delete_feature_request",
+     lambda context: api.feature_requests.delete_feature_request(
+         CLIENTS[0], context["created"]["_id"]),
+     {"partitions": 1}),
+
+    ("retrieve_report_clients",
+     lambda context: api.reports.retrieve_report("clients"),
+     {"max_rows": 1}),
+
+    ("retrieve_report_product_areas",
+     lambda context: api.reports.retrieve_report("product_areas"),
+     {"max_rows": 1}),
+
+    ("retrieve_report_target_months",
+     lambda context: api.reports.retrieve_report("target_months"),
+     {"max_rows": 1}),
+]
+
+
+def plan_nodes(plan):
+    """Yields every node of a plan tree."""
+
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def plan_shape(plan):
+    """Describes a plan's structure, ignoring costs and estimates.
+
+    Client partitions are all named alike, and repeated identical subplans
+    (e.g. one per partition) collapse into one, so the shape doesn't depend
+    on how many clients exist.
+    """
+
+    relation = re.sub(r"^feature_requests_\d+$", "feature_requests_N",
+                      plan.get("Relation Name", ""))
+    index = re.sub(r"^feature_requests_\d+_", "feature_requests_N_",
+                   plan.get("Index Name", ""))
+    children = []
+    for child in map(plan_shape, plan.get("Plans", [])):
+        if child not in children:
+            children.append(child)
+
+    return [plan["Node Type"], plan.get("Join Type", ""), relation, index, children]
+
+
+class TestQueryPlans(unittest.TestCase):
+    maxDiff = None
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            # Compacted first, as rows other tests leave behind would pin the
+            # pages of their deleted rows and make the seeded tables larger
+            cursor.execute("VACUUM FULL")
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                                  SELECT client, 'Plan client ' || client
+                                  FROM generate_series(%(first_client)s, %(last_client)s)
+                                      AS client;
+
+                              INSERT INTO feature_request.product_areas (_id, name)
+                                  SELECT area, 'Plan area ' || area
+                                  FROM generate_series(%(first_area)s, %(last_area)s)
+                                      AS area;
+
+                              INSERT INTO feature_request.feature_requests
+                                  (_id, title, description, client_id, client_rank,
+                                   target_date, ticket_url, product_area_id)
+                                  SELECT md5(client || '-' || n)::uuid,
+                                      'Request ' || n, repeat('x', 200), client,
+                                      n * 65536, date '2016-01-01' + n %% 730, NULL,
+                                      %(first_area)s + n %% 4
+                                  FROM generate_series(%(first_client)s, %(last_client)s)
+                                          AS client,
+                                      generate_series(1, %(requests)s) AS n;
+
+                              INSERT INTO feature_request.users
+                                  (username, full_name, password_hash)
+                                  SELECT '__plan' || n, 'Plan user', ''
+                                  FROM generate_series(1, %(users)s) AS n;
+
+                              INSERT INTO feature_request.sessions (username, token)
+                                  SELECT username, convert_to(md5(username), 'UTF8')
+                                  FROM feature_request.users
+                                  WHERE username LIKE '\\_\\_plan%%';
+
+                              INSERT INTO feature_request.users
+                                  (username, full_name, password_hash)
+                                  VALUES (%(username)s, 'Plan user', %(password_hash)s);
+                           """,
+                           {"first_client": CLIENTS[0],
+                            "last_client": CLIENTS[-1],
+                            "first_area": PRODUCT_AREAS[0],
+                            "last_area": PRODUCT_AREAS[-1],
+                            "requests": REQUESTS_PER_CLIENT,
+                            "users": USERS,
+                            "username": USERNAME,
+                            "password_hash": bcrypt.hashpw(PASSWORD.encode("utf8"),
+                                                           bcrypt.gensalt(4)).decode("utf8")})
+
+            # Vacuumed, as autovacuum keeps production tables, so dead rows
+            # left by earlier runs don't change the plans
+            cursor.execute("VACUUM ANALYZE")
+
+        cls.statements = cls.record_statements()
+
+        # When updating, start afresh, so removed statements drop out
+        cls.fingerprints = {}
+        if not os.environ.get("UPDATE_PLAN_FINGERPRINTS"):
+            try:
+                with open(FINGERPRINTS_PATH) as fingerprints_file:
+                    cls.fingerprints = json.load(fingerprints_file)
+            except FileNotFoundError:
+                pass
+        cls.fingerprints_changed = False
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.users
+                              WHERE username LIKE '\\_\\_plan%%';
+
+                              DELETE FROM feature_request.clients
+                              WHERE _id BETWEEN %(first_client)s AND %(last_client)s;
+
+                              -- The triggers leave counts at 0 rather than
+                              -- deleting them, which would change later plans
+                              DELETE FROM feature_request.feature_request_counts
+                              WHERE client_id BETWEEN %(first_client)s AND %(last_client)s;
+
+                              DELETE FROM feature_request.product_areas
+                              WHERE _id BETWEEN %(first_area)s AND %(last_area)s;
+                           """,
+                           {"first_client": CLIENTS[0],
+                            "last_client": CLIENTS[-1],
+                            "first_area": PRODUCT_AREAS[0],
+                            "last_area": PRODUCT_AREAS[-1]})
+
+            for client_id in CLIENTS:
+                cursor.execute("DROP TABLE feature_request.feature_requests_{}"
+                               .format(client_id))
+
+        if cls.fingerprints_changed:
+            with open(FINGERPRINTS_PATH, "w") as fingerprints_file:
+                json.dump(cls.fingerprints, fingerprints_file, indent=4, sort_keys=True)
+                fingerprints_file.write("\n")
+
+    @classmethod
+    def record_statements(cls):
+        """Runs every scenario, returning the statements each executed."""
+
+        statements = {}
+        context = {}
+
+        original_factory = database.connection.cursor_factory
+        database.connection.cursor_factory = RecordingDictCursor
+        try:
+            with unittest.mock.patch.object(database, "TupleCursor", RecordingTupleCursor):
+                for (name, scenario, _) in SCENARIOS:
+                    _RecordingCursorMixin.statements = []
+                    scenario(context)
+                    statements[name] = _RecordingCursorMixin.statements
+        finally:
+            database.connection.cursor_factory = original_factory
+
+        return statements
+
+    def explain(self, statement):
+        """Returns the root node of a statement's plan."""
+
+        with database.connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement)
+            return cursor.fetchone()["QUERY PLAN"][0]["Plan"]
+
+    def check_plan(self, key, plan, expectations):
+        nodes = list(plan_nodes(plan))
+
+        partitions = {node["Relation Name"] for node in nodes
+                      if re.match(r"^feature_requests_\d+$",
+                                  node.get("Relation Name", ""))}
+        if expectations.get("partitions"):
+            self.assertLessEqual(len(partitions), expectations["partitions"],
+                                 "{} isn't pruned: {}".format(key, sorted(partitions)))
+
+        if not expectations.get("full_scan"):
+            for node in nodes:
+                if node["Node Type"] != "Seq Scan":
+                    continue
+                relation = node["Relation Name"]
+                if relation in SMALL_TABLES:
+                    continue
+                if relation in partitions and expectations.get("client_scoped"):
+                    continue
+                self.fail("{} sequentially scans {}".format(key, relation))
+
+        if expectations.get("max_rows"):
+            self.assertLessEqual(plan["Plan Rows"], expectations["max_rows"],
+                                 "{} estimates too many rows".format(key))
+
+        shape = plan_shape(plan)
+        fingerprint = hashlib.sha1(json.dumps(shape).encode("utf8")).hexdigest()
+        self.assertEqual(database.connection.server_version // 10000,
+                         FINGERPRINTS_SERVER_VERSION,
+                         "Fingerprints are for PostgreSQL {}, so can't check {}"
+                         .format(FINGERPRINTS_SERVER_VERSION, key))
+        if os.environ.get("UPDATE_PLAN_FINGERPRINTS"):
+            type(self).fingerprints[key] = fingerprint
+            type(self).fingerprints_changed = True
+        else:
+            self.assertIn(key, self.fingerprints,
+                          "No fingerprint for {}, plan:\n{}\n"
+                          "Rerun with UPDATE_PLAN_FINGERPRINTS=1 to record it."
+                          .format(key, json.dumps(shape, indent=2)))
+            self.assertEqual(self.fingerprints[key], fingerprint,
+                             "Plan for {} changed, now:\n{}\n"
+                             "Rerun with UPDATE_PLAN_FINGERPRINTS=1 if intended."
+                             .format(key, json.dumps(shape, indent=2)))
+
+    def test_every_scenario_executes_sql(self):
+        for (name, _, _) in SCENARIOS:
+            self.assertTrue(self.statements[name], "{} executed no SQL".format(name))
+
+    def test_query_plans(self):
+        for (name, _, expectations) in SCENARIOS:
+            statements = self.statements[name]
+            if isinstance(expectations, dict):
+                expectations = [expectations] * len(statements)
+            self.assertEqual(len(expectations), len(statements),
+                             "{} expects {} statements, executed {}"
+                             .format(name, len(expectations), len(statements)))
+
+            for (i, (statement, statement_expectations)) in enumerate(
+                    zip(statements, expectations)):
+                key = "{}[{}]".format(name, i)
+                with self.subTest(key):
+                    self.check_plan(key, self.explain(statement), statement_expectations)
+
+
+if __name__ == '__main__':
+    unittest.main()
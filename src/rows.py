@@ -0,0 +1,105 @@
+"""Compact result sets for large listings.
+
+RealDictCursor builds a dict, with its own keys, for every row. Rows instead
+keeps each row as the tuple psycopg2 returns, sharing a single tuple of
+column names, and serializes straight to JSON objects from that schema.
+"""
+
+import json
+import json.encoder
+
+
+# JSON encoders for the column types our queries return
+_ENCODERS = {
+    str: json.encoder.encode_basestring_ascii,
+    int: int.__repr__,
+    bool: lambda value: "true" if value else "false",
+    type(None): lambda value: "null",
+}
+
+# Rows encoded at once by to_json(); bounds its temporary strings
+_BATCH_SIZE = 1000
+
+
+def _encode(value):
+    """Encodes a single JSON value of any type."""
+
+    encoder = _ENCODERS.get(type(value))
+    return encoder(value) if encoder else json.dumps(value)
+
+
+def _encoder_for(values):
+    """Chooses the fastest encoder able to encode every value given."""
+
+    types = set(map(type, values))
+    if len(types) == 1:
+        return _ENCODERS.get(types.pop(), _encode)
+    return _encode
+
+
+class Rows():
+    """A result set of tuples sharing one column schema.
+
+    Iterating or indexing yields rows as dicts, for code that expects
+    RealDictCursor results, but serializing with to_json() never builds them.
+
+    Attributes:
+        columns: A tuple of column names.
+        rows: A list of tuples, one value per column.
+    """
+
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns, rows):
+        """Initializes Rows with a column schema and row tuples."""
+
+        self.columns = tuple(columns)
+        self.rows = rows
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        """Fetches all remaining rows from a tuple-returning cursor."""
+
+        return cls((column[0] for column in cursor.description),
+                   cursor.fetchall())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for row in self.rows:
+            yield dict(zip(self.columns, row))
+
+    def __getitem__(self, index):
+        return dict(zip(self.columns, self.rows[index]))
+
+    def to_json(self):
+        """Serializes the rows as a JSON array of objects.
+
+        Returns:
+            The JSON document, as a str.
+        """
+
+        if not self.rows:
+            return "[]"
+
+        # One %-template per row, built once from the schema
+        template = "{" + ", ".join(json.dumps(column).replace("%", "%%") + ": %s"
+                                   for column in self.columns) + "}"
+
+        # Encode a batch at a time, column by column, so each column's
+        # values go through one encoder chosen for their type, then fill in
+        # a template per row. Each batch is joined before the next is
+        # encoded, so only one batch's encoded values exist at once.
+        chunks = []
+        for start in range(0, len(self.rows), _BATCH_SIZE):
+            batch = self.rows[start:start + _BATCH_SIZE]
+            encoded = [list(map(_encoder_for(values), values))
+                       for values in zip(*batch)]
+            chunks.append(", ".join(map(template.__mod__, zip(*encoded))))
+
+        # Bracket the end chunks rather than the whole document, to avoid
+        # copying it
+        chunks[0] = "[" + chunks[0]
+        chunks[-1] += "]"
+        return ", ".join(chunks)
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""Compares dict rows with compact Rows for a large feature request listing.
+
+Reports memory per row, time to serialize to JSON, and peak memory while
+building and serializing a listing end to end. Needs no database:
+rows are generated to match retrieve_feature_requests' columns.
+
+Usage:
+    python rows_benchmark.py [row count]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+
+from rows import Rows
+
+
+COLUMNS = ("_id", "title", "description", "client_id", "client_priority",
+           "target_date", "ticket_url", "product_area_id")
+
+
+def make_rows(count):
+    """Generates row tuples shaped like a feature request listing."""
+
+    return [(str(uuid.uuid1()), "Request {}".format(i), "Description of request {}".format(i),
+             i % 50, i // 50 + 1, "2016-04-01", None, i % 4 + 1)
+            for i in range(count)]
+
+
+def allocated(build):
+    """Returns what build() returns and the bytes it allocated."""
+
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def peak(function):
+    """Returns the peak bytes allocated while function() ran."""
+
+    tracemalloc.start()
+    function()
+    _, size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def timed(function):
+    """Returns what function() returns and the seconds it took."""
+
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(count):
+    values = [list(row) for row in make_rows(count)]
+
+    # Both hold the same value objects, so this compares only the
+    # per-row containers.
+    dicts, dict_bytes = allocated(
+        lambda: [dict(zip(COLUMNS, row)) for row in values])
+    rows, rows_bytes = allocated(
+        lambda: Rows(COLUMNS, [tuple(row) for row in values]))
+
+    # Building dicts is a cost RealDictCursor pays per row (in Python, so
+    # more than this); the tuples are what psycopg2 returns anyway.
+    _, dict_build_time = timed(
+        lambda: [dict(zip(COLUMNS, row)) for row in values])
+
+    dict_json, dict_time = timed(lambda: json.dumps(dicts))
+    rows_json, rows_time = timed(rows.to_json)
+    assert json.loads(dict_json) == json.loads(rows_json)
+    del dicts, rows, dict_json, rows_json
+
+    # What a request pays: the result set and the JSON document, together
+    dict_peak = peak(
+        lambda: json.dumps([dict(zip(COLUMNS, row)) for row in values]))
+    rows_peak = peak(
+        lambda: Rows(COLUMNS, [tuple(row) for row in values]).to_json())
+
+    print("{} rows".format(count))
+    print("memory per row, excluding values: dicts {:.0f} B, Rows {:.0f} B".format(
+        dict_bytes / count, rows_bytes / count))
+    print("build dicts: {:.3f}s".format(dict_build_time))
+    print("serialize: json.dumps(dicts) {:.3f}s, Rows.to_json {:.3f}s".format(
+        dict_time, rows_time))
+    print("peak memory, build and serialize: dicts {:.1f} MB, Rows {:.1f} MB".format(
+        dict_peak / 1e6, rows_peak / 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
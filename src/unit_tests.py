@@ -4,17 +4,29 @@ import base64
 import bcrypt
 import inspect
 import json
+import os
 import unittest
 import requests
 import sys
+import tempfile
 import threading
 import time
 import wsgiref.simple_server
 
+import admission
+import api.bootstrap
+import api.feature_requests
+import api.reports
 import app
 import authentication
+import cache
 from crud_controller import crud, CRUDException
 import database
+from rows import Rows
+
+
+app.create_app()
+database.connect()
 
 
 class TestCRUDController(unittest.TestCase):
@@ -22,6 +34,7 @@ class TestCRUDController(unittest.TestCase):
 
     def test_crud_registry_methods(self):
         self.assertTrue("PUT" in crud._registry)
+        self.assertTrue("PATCH" in crud._registry)
         self.assertTrue("GET" in crud._registry)
         self.assertTrue("POST" in crud._registry)
         self.assertTrue("DELETE" in crud._registry)
@@ -81,6 +94,218 @@ class TestCRUDController(unittest.TestCase):
             crud.handle("GET", "/bork/bork/bork")
 
 
+class TestAdmission(unittest.TestCase):
+    def test_admit_unlimited(self):
+        controller = admission.AdmissionController()
+        with controller.admit("test"), controller.admit("test"):
+            pass
+
+    def test_admit_max_in_flight(self):
+        controller = admission.AdmissionController(max_in_flight=1)
+        with controller.admit("test"):
+            with self.assertRaisesRegex(admission.AdmissionException, "503 .*"):
+                with controller.admit("other"):
+                    pass
+        with controller.admit("other"):
+            pass
+
+    def test_admit_endpoint_limit(self):
+        controller = admission.AdmissionController(endpoint_limits={"test": 1})
+        with controller.admit("test"):
+            with controller.admit("other"):
+                pass
+            with self.assertRaisesRegex(admission.AdmissionException, "503 .*"):
+                with controller.admit("test"):
+                    pass
+
+    def test_admit_shared_across_processes(self):
+        controller = admission.AdmissionController(max_in_flight=1)
+        reader, writer = os.pipe()
+
+        pid = os.fork()
+        if not pid:
+            with controller.admit("test"):
+                os.write(writer, b"x")
+                time.sleep(1)
+            os._exit(0)
+
+        os.read(reader, 1)
+        with self.assertRaisesRegex(admission.AdmissionException, "503 .*"):
+            with controller.admit("test"):
+                pass
+        os.waitpid(pid, 0)
+
+    def test_admit_reclaims_dead_processes(self):
+        controller = admission.AdmissionController(max_in_flight=1)
+        reader, writer = os.pipe()
+
+        pid = os.fork()
+        if not pid:
+            with controller.admit("test"):
+                os.write(writer, b"x")
+                time.sleep(60)
+
+        os.read(reader, 1)
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        with controller.admit("test"):
+            pass
+
+    def test_admit_after_lock_holder_killed(self):
+        controller = admission.AdmissionController(max_in_flight=1)
+        reader, writer = os.pipe()
+
+        pid = os.fork()
+        if not pid:
+            with controller._locked():
+                os.write(writer, b"x")
+                time.sleep(60)
+
+        os.read(reader, 1)
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        with controller.admit("test"):
+            pass
+        controller.check_rate("test")
+
+    def test_admit_out_of_process_slots(self):
+        controller = admission.AdmissionController(max_in_flight=100, process_slots=2)
+        reader, writer = os.pipe()
+
+        # Each process keeps its slot for life, even between requests
+        pids = []
+        for _ in range(2):
+            pid = os.fork()
+            if not pid:
+                with controller.admit("test"):
+                    pass
+                os.write(writer, b"x")
+                time.sleep(60)
+                os._exit(0)
+            pids.append(pid)
+            os.read(reader, 1)
+
+        try:
+            with self.assertRaisesRegex(admission.AdmissionException, "503 .*"):
+                with controller.admit("test"):
+                    pass
+        finally:
+            for pid in pids:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+
+        with controller.admit("test"):
+            pass
+
+    def test_check_rate(self):
+        controller = admission.AdmissionController(rate=1, burst=2)
+        controller.check_rate("test")
+        controller.check_rate("test")
+        with self.assertRaises(admission.AdmissionException) as context:
+            controller.check_rate("test")
+        self.assertEqual(context.exception.status, "429 Too Many Requests")
+        self.assertEqual(context.exception.retry_after, 1)
+
+        # Other users have their own buckets
+        controller.check_rate("other")
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + "/test.cache"
+        self.cache = cache.SharedCache(self.path, slots=16, slot_size=256)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cache_set_get(self):
+        self.cache.set("foo", b"bar", 60)
+        self.assertEqual(self.cache.get("foo"), b"bar")
+        self.assertIsNone(self.cache.get("bork"))
+
+    def test_cache_overwrite(self):
+        self.cache.set("foo", b"bar", 60)
+        self.cache.set("foo", b"foobar", 60)
+        self.assertEqual(self.cache.get("foo"), b"foobar")
+
+    def test_cache_delete(self):
+        self.cache.set("foo", b"bar", 60)
+        self.cache.delete("foo")
+        self.assertIsNone(self.cache.get("foo"))
+
+    def test_cache_ttl(self):
+        self.cache.set("foo", b"bar", 0.1)
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get("foo"))
+
+    def test_cache_too_large(self):
+        self.cache.set("foo", bytes(self.cache.capacity + 1), 60)
+        self.assertIsNone(self.cache.get("foo"))
+
+    def test_cache_lru_eviction(self):
+        self.cache.set("foo", b"bar", 60)
+        for i in range(100):
+            self.cache.set(str(i), b"x", 60)
+            self.cache.get("foo")
+        self.assertEqual(self.cache.get("foo"), b"bar")
+
+    def test_cache_shared_across_processes(self):
+        pid = os.fork()
+        if not pid:
+            self.cache.set("foo", b"from child", 60)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self.cache.get("foo"), b"from child")
+
+    def test_cache_survives_reopening(self):
+        self.cache.set("foo", b"bar", 60)
+        reopened = cache.SharedCache(self.path, slots=16, slot_size=256)
+        self.assertEqual(reopened.get("foo"), b"bar")
+
+    def test_cache_layout_change(self):
+        large = cache.SharedCache(self.path, slots=64, slot_size=1024)
+        large.set("foo", b"bar", 60)
+        reopened = cache.SharedCache(self.path, slots=8, slot_size=128)
+        self.assertIsNone(reopened.get("foo"))
+
+        # Caches with the old layout keep working, all the way through
+        self.assertEqual(large.get("foo"), b"bar")
+        for i in range(1000):
+            large.set(str(i), b"x", 60)
+
+    def test_cache_replaces_bad_file(self):
+        self.cache.set("foo", b"bar", 60)
+        with open(self.cache.path, "r+b") as cache_file:
+            cache_file.write(b"BADMAGIC")
+
+        reopened = cache.SharedCache(self.path, slots=16, slot_size=256)
+        self.assertIsNone(reopened.get("foo"))
+        reopened.set("foo", b"new", 60)
+        self.assertEqual(cache.SharedCache(self.path, slots=16, slot_size=256).get("foo"),
+                         b"new")
+
+        # The old file stays mapped, and usable, until it's reopened
+        self.assertEqual(self.cache.get("foo"), b"bar")
+
+    def test_crud_handle_cached(self):
+        calls = []
+
+        @crud.retrieve("test_cached", requires_authn=False)
+        def test_api_function(a):
+            calls.append(a)
+            return {"foo": a}
+
+        crud.cache, crud.cache_ttl = self.cache, {"test_cached": 60}
+        try:
+            self.assertEqual(crud.handle("GET", "/test_cached/bar"), '{"foo": "bar"}')
+            self.assertEqual(crud.handle("GET", "/test_cached/bar"), '{"foo": "bar"}')
+        finally:
+            crud.cache, crud.cache_ttl = None, {}
+
+        self.assertEqual(calls, ["bar"])
+
+
 class TestDatabase(unittest.TestCase):
     def test_database_connection(self):
         self.assertTrue(database.connection)
@@ -88,6 +313,40 @@ class TestDatabase(unittest.TestCase):
     def test_database_cursor(self):
         self.assertTrue(database.connection.cursor())
 
+    def test_database_connect_reuses_connection(self):
+        self.assertIs(database.connect(), database.connection)
+
+    def test_database_connect_after_fork(self):
+        parent_connection = database.connection
+
+        pid = os.fork()
+        if not pid:
+            # Child: must open its own connection, not reuse the parent's
+            ok = False
+            try:
+                child_connection = database.connect()
+                with child_connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 AS result")
+                    ok = (child_connection is not parent_connection and
+                          cursor.fetchone() == {"result": 1})
+            finally:
+                os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+        # And the parent's connection must survive the child exiting
+        with database.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 AS result")
+            self.assertEqual(cursor.fetchone(), {"result": 1})
+
+    def test_database_tuple_cursor(self):
+        with database.tuple_cursor() as cursor:
+            cursor.execute("SELECT UNNEST(ARRAY[1, 2, 3]) AS result")
+            rows = Rows.from_cursor(cursor)
+            self.assertEqual(rows.columns, ("result",))
+            self.assertEqual(rows.rows, [(1,), (2,), (3,)])
+
     def test_database_autocommit(self):
         self.assertTrue(database.connection.autocommit)
 
@@ -104,6 +363,100 @@ class TestDatabase(unittest.TestCase):
                              [{"result": 1}, {"result": 2}, {"result": 3}])
 
 
+class TestRows(unittest.TestCase):
+    COLUMNS = ("id", "name", "note", "50%", "active")
+    ROWS = [(1, "foo", None, 1.5, True),
+            (2, "b\u00e4r \"quoted\"", "note", 2.5, False)]
+
+    def test_rows_iterate_as_dicts(self):
+        rows = Rows(self.COLUMNS, self.ROWS)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0], dict(zip(self.COLUMNS, self.ROWS[0])))
+        self.assertEqual(list(rows),
+                         [dict(zip(self.COLUMNS, row)) for row in self.ROWS])
+
+    def test_rows_to_json(self):
+        rows = Rows(self.COLUMNS, self.ROWS)
+        self.assertEqual(json.loads(rows.to_json()), json.loads(json.dumps(list(rows))))
+
+    def test_rows_to_json_empty(self):
+        self.assertEqual(Rows(self.COLUMNS, []).to_json(), "[]")
+
+    def test_rows_to_json_batches(self):
+        # Several batches, the last partial, with a column's type varying
+        rows = Rows(self.COLUMNS, self.ROWS * 1250 + [(3, None, "note", 3, True)])
+        self.assertEqual(json.loads(rows.to_json()), json.loads(json.dumps(list(rows))))
+
+
+class TestDeadlines(unittest.TestCase):
+    """Fault injection: slow requests must be cut off at their deadline,
+    leaving the connection usable for the next request."""
+
+    @classmethod
+    def setUpClass(cls):
+        @crud.retrieve("slow_query", requires_authn=False)
+        def slow_query(seconds: float):
+            with database.connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(%s)", (seconds,))
+
+        @crud.retrieve("slow_handler", requires_authn=False)
+        def slow_handler(seconds: float):
+            time.sleep(seconds)
+            with database.connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        crud.deadlines = {"slow_query": 0.5, "slow_handler": 0.5}
+
+    @classmethod
+    def tearDownClass(cls):
+        crud.deadlines = {}
+
+    def assertHealthy(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            self.assertEqual(cursor.fetchone(), {"statement_timeout": "0"})
+
+    def test_within_deadline(self):
+        self.assertEqual(crud.handle("GET", "/slow_query/0"), '{"status": "OK"}')
+        self.assertHealthy()
+
+    def test_slow_query_cancelled(self):
+        started = time.monotonic()
+        with self.assertRaisesRegex(CRUDException, "504 .*"):
+            crud.handle("GET", "/slow_query/5")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertHealthy()
+
+    def test_query_after_deadline_not_run(self):
+        with self.assertRaisesRegex(CRUDException, "504 .*"):
+            crud.handle("GET", "/slow_handler/1")
+        self.assertHealthy()
+
+    def leave_timeout(self, seconds):
+        """Leaves a statement_timeout set, as a request ending with that
+        long left before its deadline would."""
+
+        database.set_deadline(seconds)
+        try:
+            with database.connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        finally:
+            database.clear_deadline()
+
+    def test_short_timeout_left_behind(self):
+        self.leave_timeout(0.05)
+        self.assertEqual(crud.handle("GET", "/slow_query/0.2"), '{"status": "OK"}')
+        self.assertHealthy()
+
+    def test_long_timeout_left_behind(self):
+        self.leave_timeout(30)
+        started = time.monotonic()
+        with self.assertRaisesRegex(CRUDException, "504 .*"):
+            crud.handle("GET", "/slow_query/5")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertHealthy()
+
+
 class TestAuthn(unittest.TestCase):
     USERNAME = "__test"
     PASSWORD = "test"
@@ -162,6 +515,467 @@ class TestAuthn(unittest.TestCase):
             authentication.get_user_for_session("bad token")
 
 
+class TestFeatureRequestPriority(unittest.TestCase):
+    CLIENT_ID = 1001
+    PRODUCT_AREA_ID = 1001
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (%s, '__test');
+                              INSERT INTO feature_request.product_areas (_id, name)
+                              VALUES (%s, '__test');
+                           """,
+                           (cls.CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.clients WHERE _id = %s;
+                              DELETE FROM feature_request.product_areas WHERE _id = %s;
+                              DROP TABLE feature_request.feature_requests_1001;
+                           """,
+                           (cls.CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    def setUp(self):
+        self.ids = [api.feature_requests.create_feature_request(data={
+                        "title": str(priority),
+                        "description": "",
+                        "client_id": self.CLIENT_ID,
+                        "client_priority": priority,
+                        "target_date": "2000-01-01",
+                        "ticket_url": None,
+                        "product_area_id": self.PRODUCT_AREA_ID
+                    })["_id"]
+                    for priority in (1, 2, 3)]
+
+    def tearDown(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.feature_requests
+                              WHERE client_id = %s
+                           """,
+                           (self.CLIENT_ID,))
+
+    def ranks(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""SELECT _id::text, client_rank
+                              FROM feature_request.feature_requests
+                              WHERE client_id = %s
+                           """,
+                           (self.CLIENT_ID,))
+            return {row["_id"]: row["client_rank"] for row in cursor.fetchall()}
+
+    def order(self):
+        requests = api.feature_requests.retrieve_feature_requests_for_client(self.CLIENT_ID)
+        self.assertEqual([request["client_priority"] for request in requests],
+                         list(range(1, len(requests) + 1)))
+        return [request["_id"] for request in requests]
+
+    def test_create_order(self):
+        self.assertEqual(self.order(), self.ids)
+
+    def test_move_updates_one_row(self):
+        before = self.ranks()
+        api.feature_requests.update_feature_request_priority(
+            self.ids[2], data={"client_priority": 1})
+
+        self.assertEqual(self.order(), [self.ids[2], self.ids[0], self.ids[1]])
+        after = self.ranks()
+        self.assertEqual([_id for _id in before if before[_id] != after[_id]],
+                         [self.ids[2]])
+
+    def test_move_rebalances_when_out_of_gaps(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""UPDATE feature_request.feature_requests
+                              SET client_rank = title::bigint
+                              WHERE client_id = %s
+                           """,
+                           (self.CLIENT_ID,))
+
+        api.feature_requests.update_feature_request_priority(
+            self.ids[2], data={"client_priority": 2})
+
+        self.assertEqual(self.order(), [self.ids[0], self.ids[2], self.ids[1]])
+
+    def test_move_unknown(self):
+        with self.assertRaisesRegex(CRUDException, "404 .*"):
+            api.feature_requests.update_feature_request_priority(
+                "00000000-0000-0000-0000-000000000000", data={"client_priority": 1})
+
+
+class TestFeatureRequestPatch(unittest.TestCase):
+    CLIENT_ID = 1003
+    OTHER_CLIENT_ID = 1004
+    PRODUCT_AREA_ID = 1003
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (%s, '__test'), (%s, '__test');
+                              INSERT INTO feature_request.product_areas (_id, name)
+                              VALUES (%s, '__test');
+                           """,
+                           (cls.CLIENT_ID, cls.OTHER_CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.clients WHERE _id IN (%s, %s);
+                              DELETE FROM feature_request.product_areas WHERE _id = %s;
+                              DROP TABLE feature_request.feature_requests_1003;
+                              DROP TABLE feature_request.feature_requests_1004;
+                           """,
+                           (cls.CLIENT_ID, cls.OTHER_CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    def setUp(self):
+        self.request = api.feature_requests.create_feature_request(data={
+            "title": "Before",
+            "description": "Unchanged",
+            "client_id": self.CLIENT_ID,
+            "client_priority": 1,
+            "target_date": "2000-01-01",
+            "ticket_url": None,
+            "product_area_id": self.PRODUCT_AREA_ID
+        })
+
+    def tearDown(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.feature_requests
+                              WHERE client_id IN (%s, %s)
+                           """,
+                           (self.CLIENT_ID, self.OTHER_CLIENT_ID))
+
+    def stored(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""SELECT title, description, client_id, version
+                              FROM feature_request.feature_requests
+                              WHERE _id = %s
+                           """,
+                           (self.request["_id"],))
+            return cursor.fetchone()
+
+    def test_create_returns_version(self):
+        self.assertEqual(self.request["version"], 1)
+
+    def test_patch_changes_only_given_fields(self):
+        changes = api.feature_requests.patch_feature_request(
+            self.CLIENT_ID, self.request["_id"], data={"title": "After", "version": 1})
+
+        self.assertEqual(changes, {"_id": self.request["_id"], "title": "After", "version": 2})
+        self.assertEqual(self.stored(), {"title": "After", "description": "Unchanged",
+                                         "client_id": self.CLIENT_ID, "version": 2})
+
+    def test_patch_without_version(self):
+        api.feature_requests.patch_feature_request(
+            self.CLIENT_ID, self.request["_id"], data={"title": "After"})
+        self.assertEqual(self.stored()["version"], 2)
+
+    def test_patch_stale_version(self):
+        api.feature_requests.patch_feature_request(
+            self.CLIENT_ID, self.request["_id"], data={"title": "After"})
+
+        with self.assertRaisesRegex(CRUDException, "412 .*"):
+            api.feature_requests.patch_feature_request(
+                self.CLIENT_ID, self.request["_id"], data={"title": "Lost", "version": 1})
+        self.assertEqual(self.stored()["title"], "After")
+
+    def test_patch_client_goes_last(self):
+        other = api.feature_requests.create_feature_request(data=dict(
+            self.request, client_id=self.OTHER_CLIENT_ID, client_priority=1))
+
+        api.feature_requests.patch_feature_request(
+            self.CLIENT_ID, self.request["_id"], data={"client_id": self.OTHER_CLIENT_ID})
+
+        requests = api.feature_requests.retrieve_feature_requests_for_client(
+            self.OTHER_CLIENT_ID)
+        self.assertEqual([request["_id"] for request in requests],
+                         [other["_id"], self.request["_id"]])
+
+    def test_update_moves_client(self):
+        data = dict(self.request, client_id=self.OTHER_CLIENT_ID, client_priority=1)
+        updated = api.feature_requests.update_feature_request(
+            self.CLIENT_ID, self.request["_id"], data=data)
+
+        self.assertEqual(updated["version"], 2)
+        self.assertEqual(self.stored()["client_id"], self.OTHER_CLIENT_ID)
+
+    def test_update_wrong_client(self):
+        with self.assertRaisesRegex(CRUDException, "404 .*"):
+            api.feature_requests.update_feature_request(
+                self.OTHER_CLIENT_ID, self.request["_id"], data=dict(self.request))
+        self.assertEqual(self.stored()["version"], 1)
+
+    def test_delete_scoped_to_client(self):
+        api.feature_requests.delete_feature_request(self.OTHER_CLIENT_ID, self.request["_id"])
+        self.assertIsNotNone(self.stored())
+
+        api.feature_requests.delete_feature_request(self.CLIENT_ID, self.request["_id"])
+        self.assertIsNone(self.stored())
+
+    def test_patch_unknown_field(self):
+        with self.assertRaisesRegex(CRUDException, "400 .*"):
+            api.feature_requests.patch_feature_request(
+                self.CLIENT_ID, self.request["_id"], data={"client_rank": 0})
+
+    def test_patch_no_fields(self):
+        with self.assertRaisesRegex(CRUDException, "400 .*"):
+            api.feature_requests.patch_feature_request(
+                self.CLIENT_ID, self.request["_id"], data={"version": 1})
+
+    def test_patch_unknown(self):
+        with self.assertRaisesRegex(CRUDException, "404 .*"):
+            api.feature_requests.patch_feature_request(
+                self.CLIENT_ID, "00000000-0000-0000-0000-000000000000",
+                data={"title": "After"})
+
+    def test_patch_wrong_client(self):
+        with self.assertRaisesRegex(CRUDException, "404 .*"):
+            api.feature_requests.patch_feature_request(
+                self.OTHER_CLIENT_ID, self.request["_id"], data={"title": "After"})
+        self.assertEqual(self.stored()["title"], "Before")
+
+
+class TestBootstrap(unittest.TestCase):
+    CLIENT_ID = 1007
+    OTHER_CLIENT_ID = 1008
+    PRODUCT_AREA_ID = 1007
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (%s, '__other'), (%s, '__test');
+                              INSERT INTO feature_request.product_areas (_id, name)
+                              VALUES (%s, '__test');
+                           """,
+                           (cls.OTHER_CLIENT_ID, cls.CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+        for (client_id, title, client_priority) in ((cls.CLIENT_ID, "first", 1),
+                                                    (cls.CLIENT_ID, "second", 2),
+                                                    (cls.OTHER_CLIENT_ID, "other", 1),
+                                                    (cls.CLIENT_ID, "zeroth", 1)):
+            api.feature_requests.create_feature_request(data={
+                "title": title,
+                "description": "",
+                "client_id": client_id,
+                "client_priority": client_priority,
+                "target_date": "2000-01-01",
+                "ticket_url": None,
+                "product_area_id": cls.PRODUCT_AREA_ID
+            })
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.clients WHERE _id IN (%s, %s);
+                              DELETE FROM feature_request.product_areas WHERE _id = %s;
+                              DROP TABLE feature_request.feature_requests_1007;
+                              DROP TABLE feature_request.feature_requests_1008;
+                           """,
+                           (cls.CLIENT_ID, cls.OTHER_CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    def test_bootstrap(self):
+        user = {"username": "__test", "full_name": "Test", "administrator": False}
+        bootstrap = api.bootstrap.retrieve_bootstrap(user=user)
+
+        self.assertEqual(bootstrap["user"], user)
+        self.assertEqual(bootstrap["product_areas"],
+                         [{"_id": self.PRODUCT_AREA_ID, "name": "__test"}])
+        self.assertEqual(bootstrap["clients"],
+                         [{"_id": self.CLIENT_ID, "name": "__test"},
+                          {"_id": self.OTHER_CLIENT_ID, "name": "__other"}])
+
+        # Only the lowest ID client's requests, in priority order
+        requests = bootstrap["feature_requests"]
+        self.assertEqual([(request["title"], request["client_priority"]) for request in requests],
+                         [("zeroth", 1), ("first", 2), ("second", 3)])
+        self.assertEqual({request["client_id"] for request in requests}, {self.CLIENT_ID})
+        self.assertEqual(set(requests[0]),
+                         {"_id", "title", "description", "client_id", "client_priority",
+                          "target_date", "ticket_url", "product_area_id", "version"})
+
+
+class TestPartitioning(unittest.TestCase):
+    CLIENT_ID = 1002
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (%s, '__test')
+                           """,
+                           (cls.CLIENT_ID,))
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.clients WHERE _id = %s;
+                              DROP TABLE feature_request.feature_requests_1002;
+                           """,
+                           (cls.CLIENT_ID,))
+
+    def relations(self, query, params):
+        """Returns the names of the relations a query's plan scans."""
+
+        with database.connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plans = [cursor.fetchone()["QUERY PLAN"][0]["Plan"]]
+
+        relations = set()
+        while plans:
+            plan = plans.pop()
+            # ModifyTable names the partitioned table it's updating
+            if "Relation Name" in plan and plan["Node Type"] != "ModifyTable":
+                relations.add(plan["Relation Name"])
+            plans.extend(plan.get("Plans", []))
+        return relations
+
+    def test_partition_created_for_client(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""SELECT to_regclass('feature_request.feature_requests_1002')
+                                  IS NOT NULL AS exists
+                           """)
+            self.assertTrue(cursor.fetchone()["exists"])
+
+    def test_renumber_client_with_requests(self):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (1005, '__test');
+                              INSERT INTO feature_request.product_areas (_id, name)
+                              VALUES (1005, '__test');
+                           """)
+        try:
+            created = api.feature_requests.create_feature_request(data={
+                "title": "Renumbered",
+                "description": "",
+                "client_id": 1005,
+                "client_priority": 1,
+                "target_date": "2000-01-01",
+                "ticket_url": None,
+                "product_area_id": 1005
+            })
+
+            with database.connection.cursor() as cursor:
+                cursor.execute("""UPDATE feature_request.clients
+                                  SET _id = 1006
+                                  WHERE _id = 1005
+                               """)
+                cursor.execute("""SELECT client_id, tableoid::regclass::text AS partition
+                                  FROM feature_request.feature_requests
+                                  WHERE _id = %s
+                               """,
+                               (created["_id"],))
+                self.assertEqual(cursor.fetchone(),
+                                 {"client_id": 1006,
+                                  "partition": "feature_request.feature_requests_1006"})
+        finally:
+            with database.connection.cursor() as cursor:
+                cursor.execute("""DELETE FROM feature_request.clients WHERE _id IN (1005, 1006);
+                                  DELETE FROM feature_request.product_areas WHERE _id = 1005;
+                                  DROP TABLE IF EXISTS feature_request.feature_requests_1005;
+                                  DROP TABLE IF EXISTS feature_request.feature_requests_1006;
+                               """)
+
+    def test_client_queries_prune_partitions(self):
+        self.assertEqual(self.relations("""SELECT *
+                                           FROM feature_request.feature_requests
+                                           WHERE client_id = %s
+                                           ORDER BY client_rank
+                                        """,
+                                        (self.CLIENT_ID,)),
+                         {"feature_requests_1002"})
+
+        self.assertEqual(self.relations("""UPDATE feature_request.feature_requests
+                                           SET client_rank = 0
+                                           WHERE client_id = %s
+                                               AND _id = %s
+                                        """,
+                                        (self.CLIENT_ID,
+                                         "00000000-0000-0000-0000-000000000000")),
+                         {"feature_requests_1002"})
+
+
+class TestReports(unittest.TestCase):
+    CLIENT_ID = 1000
+    PRODUCT_AREA_ID = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.clients (_id, name)
+                              VALUES (%s, '__test');
+                              INSERT INTO feature_request.product_areas (_id, name)
+                              VALUES (%s, '__test');
+                           """,
+                           (cls.CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    @classmethod
+    def tearDownClass(cls):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.clients WHERE _id = %s;
+                              DELETE FROM feature_request.product_areas WHERE _id = %s;
+                              DROP TABLE feature_request.feature_requests_1000;
+                           """,
+                           (cls.CLIENT_ID, cls.PRODUCT_AREA_ID))
+
+    def client_report(self):
+        report = api.reports.retrieve_report("clients")
+        for row in report["rows"]:
+            if row["client_id"] == self.CLIENT_ID:
+                return row
+
+    def add_request(self, target_date):
+        with database.connection.cursor() as cursor:
+            cursor.execute("""INSERT INTO feature_request.feature_requests
+                              (_id, title, description, client_id,
+                               target_date, product_area_id)
+                              VALUES (md5(random()::text)::uuid, '', '', %s, %s, %s)
+                           """,
+                           (self.CLIENT_ID, target_date, self.PRODUCT_AREA_ID))
+
+    def test_report_counts_follow_changes(self):
+        self.assertEqual(self.client_report()["open"], 0)
+
+        self.add_request("2000-01-01")
+        self.add_request("2999-01-01")
+        self.assertEqual(self.client_report()["open"], 2)
+        self.assertEqual(self.client_report()["overdue"], 1)
+
+        with database.connection.cursor() as cursor:
+            cursor.execute("""UPDATE feature_request.feature_requests
+                              SET target_date = '2999-01-01'
+                              WHERE client_id = %s
+                           """,
+                           (self.CLIENT_ID,))
+        self.assertEqual(self.client_report()["overdue"], 0)
+
+        with database.connection.cursor() as cursor:
+            cursor.execute("""DELETE FROM feature_request.feature_requests
+                              WHERE client_id = %s
+                           """,
+                           (self.CLIENT_ID,))
+        self.assertEqual(self.client_report()["open"], 0)
+
+    def test_report_refresh(self):
+        self.add_request("2000-01-01")
+        before = self.client_report()
+
+        refreshed = api.reports.refresh_reports(user={"administrator": True})
+        report = api.reports.retrieve_report("clients")
+        self.assertEqual(report["refreshed"], refreshed["refreshed"])
+        self.assertEqual(self.client_report(), before)
+
+    def test_report_refresh_requires_administrator(self):
+        with self.assertRaisesRegex(CRUDException, "403 .*"):
+            api.reports.refresh_reports(user={"administrator": False})
+
+    def test_unknown_report(self):
+        with self.assertRaisesRegex(CRUDException, "404 .*"):
+            api.reports.retrieve_report("bork")
+
+
 class TestServer(unittest.TestCase):
     """Spawn a WSGI server and run tests against it"""
 
@@ -222,6 +1036,12 @@ class TestServer(unittest.TestCase):
         retrieved_foo = requests.get("http://localhost:8001/foo/%s" % self.FOO["id"]).json()
         self.assertEqual(retrieved_foo, self.FOO)
 
+    def test_2_retrieve_not_modified(self):
+        url = "http://localhost:8001/foo/%s" % self.FOO["id"]
+        etag = requests.get(url).headers["ETag"]
+        response = requests.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
     def test_3_update(self):
         updated_foo = requests.put("http://localhost:8001/foo/%s" % self.FOO["id"],
                                    data=json.dumps(self.FOO2)).json()
@@ -32,7 +32,6 @@ var ViewModel = function() {
             success: function(data, status) {
                 $.cookie("session", data["token"]);
                 viewModel.loadData();
-                viewModel.authenticated(true);
             },
 
             error: function(jqXHR, status, error) {
@@ -62,36 +61,37 @@ var ViewModel = function() {
         });
     };
 
-    this.loadData = function() {
-        // Load all product areas
+    this.loadData = function(complete) {
+        // Load the session user, reference data and the first client's
+        // feature requests in a single request
+
         $.ajax({
-            url: "/api/product_areas",
+            url: "/api/bootstrap",
             success: function(data) {
-                $.each(data, function(i, productArea) {
+                viewModel.authenticated(true);
+
+                $.each(data.product_areas, function(i, productArea) {
                     viewModel.productAreas.push(productArea);
                     viewModel.productAreaMap[productArea._id] = productArea;
                 });
-            },
-            error: displayAJAXErrors
-        })
 
-        // Load available clients
-        $.ajax({
-            url: "/api/clients",
-            success: function(data) {
-                if(data.length) {
-                    selectClient(data[0]);
+                if(data.clients.length) {
+                    viewModel.activeClient(data.clients[0]);
+                    showFeatureRequests(data.feature_requests);
                 }
                 else{
                     $("#main").show();
                     viewModel.ajaxError("No clients available!");
                 }
-                $.each(data, function(i, client) {
+                $.each(data.clients, function(i, client) {
                     client.isSelected = ko.observable(false);
                     viewModel.clients.push(client);
                 });
             },
-            error: displayAJAXErrors
+            error: complete ? function(jqXHR, status, error) {
+                $.removeCookie("session");
+            } : displayAJAXErrors,
+            complete: complete
         })
     };
 
@@ -102,22 +102,11 @@ var ViewModel = function() {
 
     // Check if user has a session cookie
     if($.cookie("session")) {
-        // If so, see if it's already valid
-        $.ajax({
-            method: "GET",
-            url: "/api/check_session",
-             success: function(data, status) {
-                 viewModel.authenticated(true);
-                 viewModel.loadData();
-             },
-             error: function(jqXHR, status, error) {
-                 $.removeCookie("session");
-             },
-             complete: function(jqXHR, status) {
-                 $("body").show();
-             }
+        // If so, try loading data with it. If the session isn't valid,
+        // fall back to the login page.
+        this.loadData(function(jqXHR, status) {
+            $("body").show();
         });
-
     }
     else {
         // Otherwise display login page
@@ -144,6 +133,11 @@ var displayAJAXErrors  =function(jqXHR, status, error) {
 };
 
 
+// Fields of a feature request that can be saved with a PATCH
+var PATCHABLE_FIELDS = ["title", "description", "client_id", "target_date",
+                        "ticket_url", "product_area_id"];
+
+
 /**
  * Individual feature request model
  */
@@ -154,8 +148,10 @@ var FeatureRequest = function(request, index) {
      */
     this.startEditing = function() {
         // Marks the FeatureRequest as being editted, swapping static text
-        // for input fields
+        // for input fields. Remembers the current values, so only the
+        // fields that change need to be saved.
 
+        this._original = ko.toJS(this);
         this._editing(true);
     };
 
@@ -168,7 +164,8 @@ var FeatureRequest = function(request, index) {
     };
 
     this.updatePriority = function(priority) {
-        // Commits client_priority changes ONLY to the REST API
+        // Commits client_priority changes ONLY to the REST API.
+        // The server keeps the other requests in order around it.
 
         this.client_priority(priority);
         if (this._id()) {
@@ -196,18 +193,38 @@ var FeatureRequest = function(request, index) {
                 data: ko.toJSON(this),
                 success: function(data, status) {
                     savedRequest._id(data._id);
+                    savedRequest._saved_client_id = data.client_id;
+                    savedRequest.version(data.version);
                 },
                 error: displayAJAXErrors
             })
         }
         else {
-            // Issue exists, issue a PUT to update
-            $.ajax({
-                method: "PUT",
-                url: "/api/feature_requests/" + this._id(),
-                data: ko.toJSON(this),
-                error: displayAJAXErrors
-            })
+            // Issue exists, issue a PATCH with just the changed fields,
+            // which fails if someone else has changed it meanwhile
+            var savedRequest = this;
+            var changes = {};
+            $.each(PATCHABLE_FIELDS, function(i, field) {
+                if (savedRequest[field]() != savedRequest._original[field]) {
+                    changes[field] = savedRequest[field]();
+                }
+            });
+
+            if (!$.isEmptyObject(changes)) {
+                changes.version = this.version();
+                $.ajax({
+                    method: "PATCH",
+                    url: "/api/feature_requests/" + this._saved_client_id + "/" + this._id(),
+                    data: ko.toJSON(changes),
+                    success: function(data, status) {
+                        if ("client_id" in data) {
+                            savedRequest._saved_client_id = data.client_id;
+                        }
+                        savedRequest.version(data.version);
+                    },
+                    error: displayAJAXErrors
+                })
+            }
         }
 
         // Ensure priorities are still ordered correctly
@@ -221,7 +238,7 @@ var FeatureRequest = function(request, index) {
         viewModel.clientRequests.remove(
             viewModel.clientRequests()[this.client_priority() - 1]
         );
-        previous.updatePriority(this.client_priority());
+        previous.client_priority(this.client_priority());
         this.updatePriority(this.client_priority() - 1);
         viewModel.clientRequests.splice(this.client_priority() - 1, 0, this);
     };
@@ -233,7 +250,7 @@ var FeatureRequest = function(request, index) {
         viewModel.clientRequests.remove(
             viewModel.clientRequests()[this.client_priority() - 1]
         );
-        next.updatePriority(this.client_priority());
+        next.client_priority(this.client_priority());
         this.updatePriority(this.client_priority() + 1);
         viewModel.clientRequests.splice(this.client_priority() -1 , 0, this);
     };
@@ -248,7 +265,7 @@ var FeatureRequest = function(request, index) {
         if (this._id()) {
             $.ajax({
                 method: "DELETE",
-                url: "/api/feature_requests/" + this._id(),
+                url: "/api/feature_requests/" + this._saved_client_id + "/" + this._id(),
                 error: displayAJAXErrors
             });
         }
@@ -263,6 +280,8 @@ var FeatureRequest = function(request, index) {
         this[key] = ko.observable(request[key]);
     }
     this._editing = ko.observable(false);
+    // The client the server has the request under, to address it by
+    this._saved_client_id = request.client_id;
     this._product_area_name = ko.observable(
         viewModel.productAreaMap[this.product_area_id()].name);
 };
@@ -275,24 +294,32 @@ var selectClient = function(client, event) {
     $.ajax({
         url: "/api/feature_requests/" + client._id,
         success: function(data, status){
-            viewModel.clientRequests.removeAll();
-            $.each(data, function(i, request) {
-                viewModel.clientRequests.push(
-                    new FeatureRequest(request, i)
-                );
-            });
-            $("#main").show();
+            showFeatureRequests(data);
         },
         error: displayAJAXErrors
     });
 };
 
 
+var showFeatureRequests = function(data) {
+    // Replace the displayed feature requests with those given
+    viewModel.clientRequests.removeAll();
+    $.each(data, function(i, request) {
+        viewModel.clientRequests.push(
+            new FeatureRequest(request, i)
+        );
+    });
+    $("#main").show();
+};
+
+
 var reindexPriorities = function() {
-    // Walk the requests and ensure priorities match the current order
+    // Walk the requests and ensure displayed priorities match the current
+    // order. The server derives priorities from the order, so there's
+    // nothing to save.
     $.each(viewModel.clientRequests(), function(i, request) {
         if (this.client_priority() != i + 1) {
-            this.updatePriority(i + 1);
+            this.client_priority(i + 1);
         }
     });
 };
@@ -310,7 +337,8 @@ var newFeatureRequest = function() {
         client_id: viewModel.activeClient()._id,
         client_priority: viewModel.clientRequests().length + 1,
         ticket_url: "",
-        "product_area_id": 1
+        "product_area_id": 1,
+        version: null // will be assigned on save
     });
     newRequest._editing(true);
     viewModel.clientRequests.push(newRequest);